@@ -2,8 +2,12 @@ import streamlit as st
 import src.pages.data_exploration
 import src.service as s
 import src.pages.sidebar as sidebar
+import src.profiler as prof
+import src.lazy_sections as ls
 from src.heatmap_scatter import HeatmapScatter 
 
+s.enable_copy_on_write()
+
 st.set_page_config(
     page_title="Interactive CO₂ Data Visualization Dashboard",
     layout="wide",
@@ -11,26 +15,28 @@ st.set_page_config(
 )
 st.title("Interactive CO₂ Data Visualization Dashboard")
 
-file_mapping = {
-    "co2_per_capita": "data/co2-emissions-per-capita.csv",
-    "Renewables": "data/renewable-share-energy.csv",
-    "Carbon_tax": "data/emissions-weighted-carbon-price.csv",
-    "Life_expectancy": "data/life-expectancy.csv",
-    "GDP_per_capita": "data/gdp-per-capita-worldbank.csv",
-}
-
-dataframes = {name: s.load_default_file(path) for name, path in file_mapping.items()}
+prof.start_run()
+ls.start_deferred_run()
 
-merged_dataframe = s.merge_dataframes(dataframes)
+with prof.stage("load_merged_dataset"):
+    merged_dataframe = s.load_merged_dataset(s.file_mapping)
 
 target_column =  "co2_per_capita"
 
-filted_dataframe, is_filtered, selected_continent, selected_country, selected_year_range = sidebar.filtering(merged_dataframe)
+filted_dataframe, is_filtered, selected_continent, selected_country, selected_year_range, attribute_predicates = sidebar.filtering(merged_dataframe)
 
-src.pages.data_exploration.page(
-    [filted_dataframe], [merged_dataframe], is_filtered, selected_continent, selected_country, selected_year_range, target_column
-)
+with prof.stage("data_exploration.page", len(filted_dataframe)):
+    src.pages.data_exploration.page(
+        [filted_dataframe], [merged_dataframe], is_filtered, selected_continent, selected_country, selected_year_range, target_column,
+        attribute_predicates
+    )
+
+with prof.stage("HeatmapScatter", len(merged_dataframe)):
+    viz = HeatmapScatter(merged_dataframe, selected_country, selected_year_range, selected_continent)
+    viz.display_scatterplot()
+    viz.display_heatmap()
+
+with prof.stage("background_jobs"):
+    ls.fill_deferred_sections()
 
-viz = HeatmapScatter(merged_dataframe, selected_country, selected_year_range, selected_continent)
-viz.display_scatterplot()
-viz.display_heatmap()
+prof.render_panel(prof.finish_run(), {"forecasts": s.get_job_runner().forecast_cache_stats()})
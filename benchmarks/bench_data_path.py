@@ -0,0 +1,262 @@
+"""Headless benchmarks for the dashboard data path.
+
+Drives the data and figure-building functions directly, without a browser,
+on the bundled CSVs and on synthetic panels scaled 1x/10x/100x (more
+countries, more years, more metrics). Reports median latency and peak
+traced memory per benchmark:
+
+    python -m benchmarks.bench_data_path
+    python -m benchmarks.bench_data_path --panels bundled 10 100 --repeat 3 --json bench.jsonl
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import warnings
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+
+import src.background_jobs as bj
+import src.data_engine as engine
+import src.figure_payload as fp
+import src.filter_engine as fe
+import src.forecasting as fc
+import src.map_frames as mf
+import src.model_zoo as mz
+import src.regression as reg
+import src.pages.data_exploration as de
+from src.correlation import CorrelationEngine
+from src.dataset_index import DatasetIndex
+from src.dataset_metadata import DatasetMetadata
+from src.future_prediction import FuturePrediction
+from src.rollups import RollupStore
+from src.pivots import PivotStore
+from src.heatmap_scatter import HeatmapScatter
+
+TARGET_COLUMN = "co2_per_capita"
+BASE_METRICS = ["co2_per_capita", "Renewables", "Carbon_tax", "Life_expectancy", "GDP_per_capita"]
+CONTINENTS = ["Africa", "Asia", "Europe", "North America", "Oceania", "South America"]
+BUNDLED_COUNTRIES = ["Norway", "Germany", "France", "China", "India"]
+
+data_engine = engine.DataEngine()
+
+# scale -> (countries, years, metrics); 1x has about as many countries as the bundled panel
+# and the row count grows roughly tenfold per step.
+SYNTHETIC_SCALES = {
+    1: (250, 124, 5),
+    10: (1250, 248, 7),
+    100: (5000, 620, 8),
+}
+
+@dataclass
+class Panel:
+    name: str
+    sources: dict
+    merged: pd.DataFrame
+    continent_index_path: str
+    continent: str
+    countries: list
+    year_range: tuple
+
+def synthetic_sources(countries: int, years: int, metrics: int, seed: int = 0) -> tuple[dict, dict]:
+    """Long-format source frames shaped like the bundled CSVs, plus a country -> continent map.
+
+    Every country starts reporting at a random year and each metric misses
+    about 5% of the remaining points, so the merge sees ragged coverage.
+    """
+    rng = np.random.default_rng(seed)
+    names = np.array([f"Country {i:05d}" for i in range(countries)], dtype=object)
+    codes = np.array([f"C{i:05d}" for i in range(countries)], dtype=object)
+    year_values = np.arange(2024 - years, 2024)
+    first_year = rng.integers(year_values[0], year_values[-1] - 10, countries)
+
+    country_column = np.repeat(names, years)
+    code_column = np.repeat(codes, years)
+    year_column = np.tile(year_values, countries)
+    covered = year_column >= np.repeat(first_year, years)
+
+    metric_names = BASE_METRICS[:metrics] + [f"metric_{i}" for i in range(max(metrics - len(BASE_METRICS), 0))]
+    sources = {}
+    for name in metric_names:
+        steps = rng.normal(0.0, 0.05, (countries, years))
+        values = np.exp(np.cumsum(steps, axis=1) + rng.normal(0.0, 1.0, (countries, 1))).ravel()
+        keep = covered & (rng.random(len(values)) > 0.05)
+        sources[name] = pd.DataFrame({
+            "country": country_column[keep],
+            "Code": code_column[keep],
+            "year": year_column[keep],
+            name: values[keep],
+        })
+
+    continents = dict(zip(names, rng.choice(CONTINENTS, countries)))
+    return sources, continents
+
+def bundled_panel() -> Panel:
+    sources = {name: pd.read_csv(path) for name, path in engine.FILE_MAPPING.items()}
+    merged = engine.add_continent_column(engine.merge_dataframes(sources))
+    merged.attrs["fingerprint"] = "bench-bundled"
+    return Panel("bundled", sources, merged, engine.CONTINENT_INDEX_PATH, "Europe", BUNDLED_COUNTRIES, (1950, 2020))
+
+def synthetic_panel(scale: int, workdir: str) -> Panel:
+    sources, continents = synthetic_sources(*SYNTHETIC_SCALES[scale], seed=scale)
+    index_path = os.path.join(workdir, f"continents-{scale}x.csv")
+    pd.DataFrame(sorted(continents.items()), columns=["country", "continent"]).to_csv(index_path, index=False)
+
+    merged = engine.add_continent_column(engine.merge_dataframes(sources), index_path)
+    merged.attrs["fingerprint"] = f"bench-synthetic-{scale}x"
+    countries = [country for country, continent in continents.items() if continent == "Europe"][:5]
+    last_year = int(merged["year"].max())
+    return Panel(f"synthetic-{scale}x", sources, merged, index_path, "Europe", countries, (last_year - 70, last_year))
+
+def _sidebar_predicates(panel: Panel) -> list:
+    metadata = data_engine.dataset_metadata(panel.merged)
+    predicates = [fe.SetPredicate("continent", (panel.continent,))]
+    for column in ("Renewables", "Life_expectancy", "GDP_per_capita"):
+        if column in panel.merged.columns:
+            low, high = metadata.column_range(column)
+            predicates.append(fe.RangePredicate(column, low + (high - low) * 0.1, high))
+    return predicates
+
+def _clear_caches():
+    fc.forecast_cache.clear()
+    mf._frame_cache.clear()
+    mz.backtest_cache.clear()
+
+def benchmarks(panel: Panel) -> dict:
+    """Benchmark name -> zero-argument callable. Per-dataset structures are built once up front."""
+    merged = panel.merged
+    index = data_engine.dataset_index(merged)
+    filtered, _ = fe.apply_filters(merged, [fe.SetPredicate("continent", (panel.continent,))], index)
+    without_continent = merged.drop(columns="continent")
+    correlations = data_engine.correlation_engine(merged)
+    rollups = data_engine.rollups(merged)
+    data_engine.pivots(merged)
+    predicates = _sidebar_predicates(panel)
+    attribute_predicates = tuple(predicate for predicate in predicates if isinstance(predicate, fe.RangePredicate))
+    attribute_filtered, _ = fe.apply_filters(merged, predicates, index)
+    attribute_rollups = data_engine.rollups(merged, attribute_predicates)
+    viz = HeatmapScatter(merged, panel.countries, panel.year_range, panel.continent)
+
+    def scatter_fit():
+        rows = viz.filtered_df.dropna(subset=["GDP_per_capita", "Life_expectancy"])
+        codes, countries = pd.factorize(rows["country"])
+        return reg.grouped_linear_fit(
+            codes, rows["GDP_per_capita"].to_numpy(), rows["Life_expectancy"].to_numpy(), len(countries)
+        )
+
+    def prediction(degree):
+        return FuturePrediction(panel.countries, 5, False, merged, TARGET_COLUMN).predict_with_model(degree)
+
+    return {
+        "merge_dataframes": lambda: engine.merge_dataframes(panel.sources),
+        "add_continent_column": lambda: engine.add_continent_column(without_continent, panel.continent_index_path),
+        "filter_by_continent": lambda: engine.filter_by_continent(merged, panel.continent),
+        "get_countries_by_continent": lambda: engine.get_countries_by_continent([merged], panel.continent),
+        "DatasetIndex build": lambda: DatasetIndex(merged),
+        "DatasetMetadata build": lambda: DatasetMetadata(merged),
+        "sidebar apply_filters (indexed)": lambda: fe.apply_filters(merged, predicates, index),
+        "sidebar apply_filters (scan)": lambda: fe.apply_filters(merged, predicates),
+        "map_figure": lambda: bj.map_figure(
+            *de.map_arguments(merged, filtered, False, panel.continent, panel.year_range, panel.countries, TARGET_COLUMN)
+        ),
+        "chart": lambda: de.chart(filtered, panel.countries, panel.year_range, TARGET_COLUMN),
+        "chart prepare_figure": lambda: fp.prepare_figure(
+            de.chart(filtered, panel.countries, panel.year_range, TARGET_COLUMN)
+        ),
+        "bar_chart": lambda: de.bar_chart(filtered, panel.year_range, False, panel.countries, TARGET_COLUMN),
+        "bar_chart (rollups)": lambda: de.bar_chart(
+            filtered, panel.year_range, False, panel.countries, TARGET_COLUMN, rollups
+        ),
+        "bar_chart (attribute filters)": lambda: de.bar_chart(
+            attribute_filtered, panel.year_range, True, panel.countries, TARGET_COLUMN
+        ),
+        "bar_chart (attribute filters, rollups)": lambda: de.bar_chart(
+            attribute_filtered, panel.year_range, True, panel.countries, TARGET_COLUMN, attribute_rollups
+        ),
+        "RollupStore build": lambda: RollupStore(merged),
+        "rollups continent series": lambda: rollups.group_series(TARGET_COLUMN, panel.continent),
+        "rollups world mean": lambda: rollups.group_mean(TARGET_COLUMN, "World", panel.year_range),
+        "PivotStore build": lambda: PivotStore(merged),
+        "FuturePrediction linear": lambda: prediction(1),
+        "FuturePrediction polynomial": lambda: prediction(4),
+        "model zoo best_forecasts": lambda: mz.best_forecasts(merged, panel.countries, TARGET_COLUMN, 5),
+        "CorrelationEngine build": lambda: CorrelationEngine(merged),
+        "heatmap correlation (continent)": lambda: correlations.correlation(
+            data_engine.dataset_metadata(merged).countries_in(panel.continent)
+        ),
+        "heatmap correlation (selection)": lambda: correlations.correlation(panel.countries, panel.year_range),
+        "scatter filter_data": viz.filter_data,
+        "scatter grouped_linear_fit": scatter_fit,
+    }
+
+def measure(function, repeat: int) -> dict:
+    """Median/min wall time over `repeat` cold runs, then one traced run for peak memory."""
+    timings = []
+    for _ in range(repeat):
+        _clear_caches()
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    _clear_caches()
+    tracemalloc.start()
+    start_bytes = tracemalloc.get_traced_memory()[0]
+    function()
+    peak_bytes = tracemalloc.get_traced_memory()[1] - start_bytes
+    tracemalloc.stop()
+    return {"median_ms": statistics.median(timings), "min_ms": min(timings), "peak_bytes": peak_bytes}
+
+def _quiet_streamlit():
+    # Streamlit calls outside `streamlit run` only warn; keep the report readable.
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith("streamlit"):
+            logging.getLogger(name).disabled = True
+
+def _revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--panels", nargs="+", default=["bundled", "1", "10"],
+                        help="'bundled' and/or synthetic scales (%s)" % ", ".join(map(str, SYNTHETIC_SCALES)))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", nargs="+", help="run only benchmarks whose name contains one of these")
+    parser.add_argument("--json", help="append one JSON line per result to this file")
+    args = parser.parse_args(argv)
+
+    warnings.filterwarnings("ignore")
+    revision = _revision()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for panel_name in args.panels:
+            _quiet_streamlit()
+            panel = bundled_panel() if panel_name == "bundled" else synthetic_panel(int(panel_name), workdir)
+            metrics = len(panel.merged.select_dtypes(include="number").columns) - 1
+            print(f"\n{panel.name}: {len(panel.merged)} rows, {panel.merged['country'].nunique()} countries, "
+                  f"{metrics} metrics")
+            print(f"{'benchmark':<36}{'median ms':>12}{'min ms':>12}{'peak MiB':>12}")
+
+            for name, function in benchmarks(panel).items():
+                if args.only and not any(part in name for part in args.only):
+                    continue
+                result = measure(function, args.repeat)
+                print(f"{name:<36}{result['median_ms']:>12.2f}{result['min_ms']:>12.2f}"
+                      f"{result['peak_bytes'] / 2**20:>12.2f}")
+                if args.json:
+                    with open(args.json, "a", encoding="utf-8") as output:
+                        output.write(json.dumps({
+                            "revision": revision, "panel": panel.name, "rows": len(panel.merged),
+                            "benchmark": name, "repeat": args.repeat, **result,
+                        }) + "\n")
+
+if __name__ == "__main__":
+    main()
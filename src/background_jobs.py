@@ -0,0 +1,221 @@
+"""Process pool for the heavy view builders.
+
+Map figures, forecasts and correlation matrices are pandas/NumPy work that
+holds the GIL, so they run in spawned worker processes instead of threads.
+Frames of the cached dataset are not pickled: a row selection travels as a
+`DatasetRef` (dataset fingerprint, row positions, columns) and each worker
+resolves it against its own memory-mapped copy of the dataset. Like
+`src.data_engine`, this module does not import Streamlit.
+"""
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import types
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+import src.data_engine as de
+import src.figure_payload as fp
+import src.forecasting as fc
+import src.map_frames as mf
+import src.pivots as pv
+import src.profiler as prof
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS_ENV = "CO2_JOB_WORKERS"
+
+# The engine jobs resolve datasets and per-dataset structures against: the
+# worker's own in a pool process, the caller's when jobs run inline.
+_engine = None
+
+# Forecast cache counters of the pool: each worker adds what changed since
+# its last job to this shared array, in CACHE_STATS order.
+CACHE_STATS = ("hits", "misses", "lookups", "evictions", "size")
+_pool_cache_stats = None
+_reported_cache_stats = dict.fromkeys(CACHE_STATS, 0)
+
+@dataclass(eq=False)
+class DatasetRef:
+    """Pickle-cheap stand-in for a row selection of the cached dataset."""
+    fingerprint: str
+    rows: np.ndarray = None
+    columns: tuple = None
+
+def default_workers() -> int:
+    """CO2_JOB_WORKERS if set (0 runs every job inline), else up to four processes."""
+    configured = os.environ.get(JOB_WORKERS_ENV)
+    if configured:
+        return max(int(configured), 0)
+    return min(4, os.cpu_count() or 1)
+
+def reference(value, dataset: pd.DataFrame):
+    """A DatasetRef for a row selection of `dataset`, or `value` unchanged.
+
+    Slices of the dataset keep its fingerprint and its row labels, which are
+    the row positions, so the labels are all a worker needs to rebuild them.
+    Frames whose labels cannot be verified as positions (a reset index, no
+    country/year columns) are sent as they are.
+    """
+    if not isinstance(value, pd.DataFrame) or value.attrs.get("fingerprint") != dataset.attrs.get("fingerprint"):
+        return value
+    if value is dataset:
+        return DatasetRef(value.attrs["fingerprint"])
+    if not set(value.columns) <= set(dataset.columns):
+        return value
+    rows = pv.row_positions(value)
+    if rows is None:
+        return value
+    columns = None if list(value.columns) == list(dataset.columns) else tuple(value.columns)
+    return DatasetRef(value.attrs["fingerprint"], rows, columns)
+
+def resolve(value):
+    """The frame a DatasetRef stands for, taken from this process's dataset."""
+    if not isinstance(value, DatasetRef):
+        return value
+    dataset = _engine.load_dataset()
+    if dataset.attrs.get("fingerprint") != value.fingerprint:
+        raise RuntimeError("The dataset changed since the job was submitted")
+    selection = dataset if value.rows is None else dataset.take(value.rows)
+    return selection if value.columns is None else selection[list(value.columns)]
+
+@contextmanager
+def _main_module_hidden():
+    """Keep spawned processes from importing the parent's __main__.
+
+    A spawned child re-imports the parent's main module; under Streamlit
+    that is the page script, which would then run inside every worker.
+    """
+    main_module = sys.modules["__main__"]
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = main_module
+
+def _init_worker(file_mapping: dict, cache_dir: str, cache_stats):
+    global _engine, _pool_cache_stats
+    _pool_cache_stats = cache_stats
+    de.enable_copy_on_write()
+    _engine = de.DataEngine(file_mapping, cache_dir=cache_dir)
+    _engine.load_dataset()
+    # Plotly loads its trace validators on first use and statsmodels takes a
+    # second to import; pay both before the first job.
+    mf.selection_map(pd.DataFrame({"country": [], "year": [], "value": []}), "value", "World", "", 1.0, "", [])
+    import src.model_zoo  # noqa: F401
+
+def _report_cache_stats():
+    current = fc.forecast_cache_stats()
+    with _pool_cache_stats.get_lock():
+        for position, name in enumerate(CACHE_STATS):
+            _pool_cache_stats[position] += current[name] - _reported_cache_stats[name]
+    _reported_cache_stats.update(current)
+
+def _run(function, args: tuple):
+    try:
+        return function(*[resolve(arg) for arg in args])
+    finally:
+        _report_cache_stats()
+
+@prof.profiled("map_figure")
+def map_figure(dataframe: pd.DataFrame, *map_args, budget: int = fp.PAYLOAD_BUDGET_BYTES, name: str = None) -> dict:
+    """Build and compact the dashboard map, returned as a plain figure dict.
+
+    A dict pickles far faster than a go.Figure, which revalidates every
+    trace when unpickled; st.plotly_chart validates it once either way.
+    Pool workers have no profiling run, so this stage is only recorded when
+    jobs run inline; the script records its wait as `deferred:<key>`.
+    """
+    with prof.stage("map_figure.selection_map"):
+        figure = mf.selection_map(dataframe, *map_args)
+    return fp.prepare_figure(figure, budget, name).to_dict()
+
+def correlation_matrix(dataset: pd.DataFrame, countries: list = None, year_range: tuple = None) -> pd.DataFrame:
+    """Correlations of a selection, from the dataset's CorrelationEngine in this process."""
+    return _engine.correlation_engine(dataset).correlation(countries, year_range)
+
+class JobRunner:
+    """Runs builders in a pool of spawned processes, or inline when it has no workers.
+
+    The pool starts all its workers on the first submitted job and each
+    worker loads the dataset once, in its initializer. Queued jobs can be cancelled through
+    their futures; a job that already started runs to completion and its
+    result is simply dropped.
+    """
+
+    def __init__(self, engine: de.DataEngine, workers: int = None):
+        global _engine
+        if _engine is None:
+            _engine = engine
+        self.engine = engine
+        self.workers = default_workers() if workers is None else workers
+        self._pool = None
+        self._threads = ThreadPoolExecutor(max_workers=2, thread_name_prefix="job-coordinator")
+        self._lock = threading.Lock()
+        self._cache_stats = multiprocessing.get_context("spawn").Array("q", len(CACHE_STATS))
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                with _main_module_hidden():
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        initializer=_init_worker,
+                        initargs=(self.engine.file_mapping, self.engine.cache_dir, self._cache_stats),
+                    )
+                    # The pool spawns a process per submit until it is full;
+                    # fill it now so no worker starts outside this block.
+                    for _ in range(self.workers):
+                        self._pool.submit(os.getpid)
+            return self._pool
+
+    def submit(self, function, *args) -> Future:
+        """Run `function(*args)` in the pool. Frames of the cached dataset are sent as DatasetRefs."""
+        if self.workers > 0:
+            dataset = self.engine.load_dataset()
+            references = tuple(reference(arg, dataset) for arg in args)
+            try:
+                return self._executor().submit(_run, function, references)
+            except BrokenProcessPool:
+                logger.warning("Background worker pool broke; restarting it")
+                with self._lock:
+                    self._pool = None
+                return self._executor().submit(_run, function, references)
+
+        future = Future()
+        try:
+            future.set_result(function(*args))
+        except Exception as error:
+            future.set_exception(error)
+        return future
+
+    def submit_local(self, function, *args) -> Future:
+        """Run `function(*args)` on a thread of this process.
+
+        For coordinators such as `mz.best_forecasts` that mostly wait on jobs
+        they spread over the pool themselves.
+        """
+        return self._threads.submit(function, *args)
+
+    def forecast_cache_stats(self) -> dict:
+        """Forecast cache counters summed over the pool's workers and this process.
+
+        Workers report after each job; `size` is the number of entries held
+        across all their caches.
+        """
+        with self._cache_stats.get_lock():
+            pooled = list(self._cache_stats)
+        local = fc.forecast_cache_stats()
+        return {name: local[name] + pooled[position] for position, name in enumerate(CACHE_STATS)}
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
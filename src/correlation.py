@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+
+BUCKET_YEARS = 10
+STATS_CHUNK_ROWS = 16384
+
+class CorrelationEngine:
+    """Pairwise-complete Pearson correlations assembled from precomputed blocks.
+
+    Rows are grouped into (country, year-bucket) blocks. For every block and
+    every column pair (i, j) the engine keeps, over the rows where both columns
+    are present: the count, Σxᵢ, Σxᵢ² and Σxᵢxⱼ. A correlation matrix for any
+    set of countries and year range is then the sum of the covered blocks; only
+    the buckets cut by the ends of the year range are recomputed from rows.
+    Values are shifted by their column means first to avoid cancellation.
+    """
+
+    def __init__(self, dataframe: pd.DataFrame, columns: list = None, bucket_years: int = BUCKET_YEARS):
+        self.columns = list(columns if columns is not None else dataframe.select_dtypes(include="number").columns)
+        self.bucket_years = bucket_years
+
+        values = dataframe[self.columns].to_numpy(dtype=np.float64)
+        self.offsets = np.nanmean(values, axis=0)
+        self.values = values - self.offsets
+
+        country = dataframe["country"]
+        if not isinstance(country.dtype, pd.CategoricalDtype):
+            country = country.astype("category")
+        self.country_codes = {name: code for code, name in enumerate(country.cat.categories)}
+        codes = country.cat.codes.to_numpy().astype(np.int64)
+
+        self.years = dataframe["year"].to_numpy()
+        self.first_year = int(self.years.min()) if len(self.years) else 0
+        buckets = (self.years.astype(np.int64) - self.first_year) // bucket_years
+        self.bucket_count = int(buckets.max()) + 1 if len(buckets) else 0
+
+        block_ids = codes * max(self.bucket_count, 1) + buckets
+        self.row_order = np.argsort(block_ids, kind="stable")
+        sorted_ids = block_ids[self.row_order]
+        self.block_ids, self.block_starts = np.unique(sorted_ids, return_index=True)
+        self.block_stops = np.append(self.block_starts[1:], len(sorted_ids))
+        self.block_countries = self.block_ids // max(self.bucket_count, 1)
+        self.block_buckets = self.block_ids % max(self.bucket_count, 1)
+
+        self.block_stats = np.zeros((len(self.block_ids), 4, len(self.columns), len(self.columns)))
+        for first, last in self._block_chunks():
+            start, stop = self.block_starts[first], self.block_stops[last - 1]
+            row_stats = self._row_statistics(self.values[self.row_order[start:stop]])
+            self.block_stats[first:last] = np.add.reduceat(row_stats, self.block_starts[first:last] - start, axis=0)
+
+        # Whole-history totals per country, for selections without a year cut.
+        self.country_stats = np.zeros((len(self.country_codes), 4, len(self.columns), len(self.columns)))
+        np.add.at(self.country_stats, self.block_countries, self.block_stats)
+
+    def _block_chunks(self):
+        """Split the blocks into runs of about STATS_CHUNK_ROWS rows, bounding the per-row statistics memory."""
+        first = 0
+        while first < len(self.block_starts):
+            last = np.searchsorted(self.block_starts, self.block_starts[first] + STATS_CHUNK_ROWS, side="right")
+            last = max(int(last) - 1, first + 1)
+            yield first, last
+            first = last
+
+    @classmethod
+    def _summed_row_statistics(cls, values: np.ndarray) -> np.ndarray:
+        return sum(
+            cls._row_statistics(values[start:start + STATS_CHUNK_ROWS]).sum(axis=0)
+            for start in range(0, len(values), STATS_CHUNK_ROWS)
+        )
+
+    @staticmethod
+    def _row_statistics(values: np.ndarray) -> np.ndarray:
+        present = ~np.isnan(values)
+        filled = np.where(present, values, 0.0)
+        both = present[:, :, None] & present[:, None, :]
+        return np.stack([
+            both,
+            filled[:, :, None] * both,
+            (filled * filled)[:, :, None] * both,
+            filled[:, :, None] * filled[:, None, :],
+        ], axis=1)
+
+    def _statistics(self, countries: list = None, year_range: tuple = None) -> np.ndarray:
+        if year_range is not None and year_range[0] <= self.first_year and year_range[1] >= self.years.max():
+            year_range = None
+        if year_range is None:
+            if countries is None:
+                return self.country_stats.sum(axis=0)
+            codes = [self.country_codes[country] for country in countries if country in self.country_codes]
+            return self.country_stats[codes].sum(axis=0)
+
+        blocks = np.ones(len(self.block_ids), dtype=bool)
+        if countries is not None:
+            codes = [self.country_codes[country] for country in countries if country in self.country_codes]
+            blocks &= np.isin(self.block_countries, codes)
+
+        bucket_start = self.first_year + self.block_buckets * self.bucket_years
+        bucket_end = bucket_start + self.bucket_years - 1
+        inside = (bucket_start >= year_range[0]) & (bucket_end <= year_range[1])
+        overlaps = (bucket_end >= year_range[0]) & (bucket_start <= year_range[1])
+        partial = blocks & overlaps & ~inside
+        blocks &= inside
+
+        totals = self.block_stats[blocks].sum(axis=0)
+        if partial.any():
+            rows = np.concatenate([
+                self.row_order[start:stop]
+                for start, stop in zip(self.block_starts[partial], self.block_stops[partial])
+            ])
+            rows = rows[(self.years[rows] >= year_range[0]) & (self.years[rows] <= year_range[1])]
+            totals = totals + self._summed_row_statistics(self.values[rows])
+        return totals
+
+    def correlation(self, countries: list = None, year_range: tuple = None) -> pd.DataFrame:
+        """Correlation matrix over `countries` (all when None) within `year_range` (inclusive)."""
+        if len(self.block_ids) == 0:
+            return pd.DataFrame(np.nan, index=self.columns, columns=self.columns)
+        count, sums, squares, products = self._statistics(countries, year_range)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            covariance = count * products - sums * sums.T
+            variance = count * squares - sums * sums
+            matrix = covariance / np.sqrt(variance * variance.T)
+        matrix[(count < 2) | (variance <= 0) | (variance.T <= 0)] = np.nan
+        matrix = np.clip(matrix, -1.0, 1.0)
+        diagonal = np.diag_indices(len(self.columns))
+        matrix[diagonal] = np.where(np.isnan(matrix[diagonal]), np.nan, 1.0)
+        return pd.DataFrame(matrix, index=self.columns, columns=self.columns)
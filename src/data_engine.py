@@ -0,0 +1,372 @@
+"""Streamlit-free data layer: merging, continent lookups and per-dataset structures.
+
+Importing this module does not import Streamlit, so benchmarks, batch jobs
+and worker processes can use it directly. `src.service` is the thin
+Streamlit adapter on top of it.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import pycountry_convert as pc
+from repoze.lru import LRUCache
+import src.dataset_cache as dc
+import src.filter_engine as fe
+import src.pivots as pv
+import src.indicator_registry as ir
+import src.profiler as prof
+from src.dataset_index import DatasetIndex
+from src.dataset_metadata import DatasetMetadata
+from src.correlation import CorrelationEngine
+from src.rollups import RollupStore
+from src.pivots import PivotStore
+
+logger = logging.getLogger(__name__)
+
+INDICATORS = ir.load_registry()
+FILE_MAPPING = ir.file_mapping(INDICATORS)
+
+CONTINENT_INDEX_PATH = "data/country-continents.csv"
+
+# Files besides the sources whose content ends up in the merged dataset, so
+# they are part of its cache key.
+BUILD_INPUTS = (CONTINENT_INDEX_PATH, ir.REGISTRY_PATH)
+
+def enable_copy_on_write():
+    """Switch on pandas copy-on-write, which is opt-in before pandas 3.0.
+
+    Every session shares one cached dataset, so frames derived from it must
+    never write through to it. Called at app start and in the worker
+    processes, not on import, so importing this module changes no pandas
+    semantics.
+    """
+    if int(pd.__version__.split(".")[0]) < 3:
+        pd.options.mode.copy_on_write = True
+
+def get_unique_column_names(dataframe: pd.DataFrame) -> list:
+  return [col for col in dataframe.columns if col not in ['country', 'iso_code', 'year']]
+
+def get_metrics(dataframes: list[pd.DataFrame]) -> dict:
+  metrics = {}
+  for dataframe in dataframes:
+    for column in get_unique_column_names(dataframe):
+      metrics[column] = (dataframe, column)
+
+  return metrics
+
+def _factorize_keys(columns: list[pd.Series]) -> tuple[np.ndarray, pd.Index]:
+    """Sorted codes over several key columns, as `pd.factorize(pd.concat(columns), sort=True)` would give.
+
+    Categorical columns (as produced by the indicator reader) are recoded
+    through the union of their categories instead of being concatenated
+    back into strings.
+    """
+    if not all(isinstance(column.dtype, pd.CategoricalDtype) for column in columns):
+        return pd.factorize(pd.concat(columns, ignore_index=True), sort=True)
+
+    categories = pd.Index(np.unique(np.concatenate([
+        column.cat.categories[np.unique(column.cat.codes[column.cat.codes >= 0])].to_numpy(dtype=object)
+        for column in columns
+    ]).astype(str)) if columns else [])
+    recoded = []
+    for column in columns:
+        lookup = np.append(categories.get_indexer(column.cat.categories), -1)
+        recoded.append(lookup[column.cat.codes.to_numpy()])
+    return np.concatenate(recoded), categories
+
+@prof.profiled("merge_dataframes", rows_in=lambda dataframes, *args, **kwargs: sum(map(len, dataframes.values())))
+def merge_dataframes(dataframes: dict, on_warning=logger.warning) -> pd.DataFrame:
+    """Merge all datasets into a single DataFrame on 'country' and 'year'.
+
+    All sources are aligned on one shared (country, year) key index in a single
+    pass: every source scatters its values straight into the output columns, so
+    no intermediate merged frames are built. 'country' and 'Code' come out as
+    categoricals, 'year' as int16 and metrics as float32. Unless memory is
+    already being traced (by the profiler, say), the peak memory used is
+    stored in `attrs["merge_peak_bytes"]`. Skipped sources are reported
+    through `on_warning`.
+    """
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    try:
+        merged_df = _merge_sources(dataframes, on_warning)
+        if merged_df is not None and started_tracing:
+            merged_df.attrs["merge_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+
+    if merged_df is not None:
+        logger.info("Merged sources into %d rows (peak %s)", len(merged_df),
+                    "%.1f MiB" % (merged_df.attrs["merge_peak_bytes"] / 2**20) if started_tracing else "not traced")
+    return merged_df
+
+def _merge_sources(dataframes: dict, on_warning) -> pd.DataFrame:
+    sources = {}
+    for name, df in dataframes.items():
+        if not {'country', 'year'}.issubset(df.columns):
+            on_warning(f"Dataset {name} is missing required columns ('country', 'year'). Skipping.")
+            continue
+        sources[name] = df
+
+    if not sources:
+        return None
+
+    country_codes, countries = _factorize_keys([df['country'] for df in sources.values()])
+    years = np.concatenate([df['year'].to_numpy(dtype=np.int64) for df in sources.values()])
+    min_year = years.min()
+    year_span = years.max() - min_year + 1
+    keys, key_positions = np.unique(country_codes * year_span + (years - min_year), return_inverse=True)
+
+    code_codes, codes = _factorize_keys([
+        df['Code'] if 'Code' in df.columns else pd.Series(pd.Categorical([None] * len(df)), index=df.index)
+        for df in sources.values()
+    ])
+
+    merged_code_codes = np.full(len(keys), -1, dtype=np.int32)
+    columns = {}
+    offset = 0
+    for df in sources.values():
+        rows = slice(offset, offset + len(df))
+        positions = key_positions[rows]
+        offset += len(df)
+
+        source_code_codes = code_codes[rows]
+        missing_code = (merged_code_codes[positions] == -1) & (source_code_codes != -1)
+        merged_code_codes[positions[missing_code]] = source_code_codes[missing_code]
+
+        for column in df.columns:
+            if column in ('country', 'year', 'Code'):
+                continue
+            values = df[column].to_numpy()
+            if column not in columns:
+                if pd.api.types.is_numeric_dtype(values.dtype):
+                    columns[column] = np.full(len(keys), np.nan, dtype=np.float32)
+                else:
+                    columns[column] = np.full(len(keys), None, dtype=object)
+            target = columns[column]
+            fill = pd.isna(target[positions]) & ~pd.isna(values)
+            target[positions[fill]] = values[fill]
+
+    merged_df = pd.DataFrame({
+        'country': pd.Categorical.from_codes(keys // year_span, categories=countries),
+        'Code': pd.Categorical.from_codes(merged_code_codes, categories=codes),
+        'year': (keys % year_span + min_year).astype(np.int16),
+        **columns,
+    })
+
+    return merged_df
+
+def build_merged_dataset(file_mapping: dict, on_warning=logger.warning) -> pd.DataFrame:
+    """Stream the indicator CSVs in, merge them and attach the continent index."""
+    dataframes = {
+        indicator.name: ir.read_indicator(indicator) for indicator in ir.resolve(file_mapping, INDICATORS)
+    }
+    return add_continent_column(merge_dataframes(dataframes, on_warning))
+
+def get_unique_countries(dataframes: list[pd.DataFrame]) -> list:
+  unique_countries = set()
+  for dataframe in dataframes:
+    unique_countries.update(dataframe['country'].unique())
+  return sorted(unique_countries)
+
+def get_unique_years(dataframes: list[pd.DataFrame]) -> list:
+  unique_years = set()
+  for dataframe in dataframes:
+    unique_years.update(int(year) for year in dataframe['year'].unique())
+  return sorted(unique_years)
+
+def get_year_range_from_countries(dataframes: list[pd.DataFrame], countries: list[str]):
+  unique_years = set()
+  for dataframe in dataframes:
+    unique_years.update(dataframe[dataframe["country"].isin(countries)]["year"].unique())
+  return sorted(unique_years)
+
+def predict_future_values_with_models(country_specific_data: pd.DataFrame, selected_metric: str, years_to_predict: int, model_to_use):
+  x = country_specific_data[["year"]]
+  y = country_specific_data[selected_metric]
+
+  model = model_to_use
+  model.fit(x, y)
+
+  future_years = np.array(range(x["year"].max() + 1, x["year"].max() + 1 + years_to_predict)).reshape(-1, 1)
+
+  predictions = model.predict(future_years)
+
+  return future_years, predictions,
+
+def country_to_continent(country_name):
+    try:
+
+        country_alpha2 = pc.country_name_to_country_alpha2(country_name)
+        country_continent_code = pc.country_alpha2_to_continent_code(country_alpha2)
+        country_continent_name = pc.convert_continent_code_to_continent_name(country_continent_code)
+        return country_continent_name
+    except Exception as e:
+        return None
+
+def load_continent_index(countries, index_path: str = CONTINENT_INDEX_PATH) -> dict:
+    """Map countries to continents, reading the persisted index and extending it with unseen countries."""
+    if os.path.exists(index_path):
+        index_df = pd.read_csv(index_path, keep_default_na=False)
+        index = {row.country: (row.continent or None) for row in index_df.itertuples(index=False)}
+    else:
+        index = {}
+
+    missing = [country for country in countries if country not in index]
+    if missing:
+        for country in missing:
+            index[country] = country_to_continent(country)
+        # Replace the file in one step: other threads and worker processes may be reading it.
+        tmp_path = f"{index_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        pd.DataFrame(
+            sorted(index.items()), columns=["country", "continent"]
+        ).to_csv(tmp_path, index=False)
+        os.replace(tmp_path, index_path)
+
+    return index
+
+def add_continent_column(dataframe: pd.DataFrame, index_path: str = CONTINENT_INDEX_PATH) -> pd.DataFrame:
+    """Attach a categorical 'continent' column so continent filters need no lookups."""
+    countries = dataframe["country"].dropna().unique()
+    continent_index = load_continent_index(countries, index_path)
+    continents = sorted({continent for continent in continent_index.values() if continent})
+
+    dataframe = dataframe.copy()
+    dataframe["continent"] = pd.Categorical(dataframe["country"].map(continent_index), categories=continents)
+    return dataframe
+
+def filter_by_continent(dataframe: pd.DataFrame, continent: str) -> pd.DataFrame:
+    if "continent" not in dataframe.columns:
+        dataframe = add_continent_column(dataframe)
+    return dataframe[dataframe["continent"] == continent]
+
+def get_unique_continents(dataframes: list) -> list:
+    continents = set()
+    for dataframe in dataframes:
+        if "continent" not in dataframe.columns:
+            dataframe = add_continent_column(dataframe)
+        continents.update(dataframe["continent"].dropna().unique())
+    continents.discard("Oceania")
+    return sorted(continents)
+
+def get_countries_by_continent(dataframes: list, selected_continent: str) -> list:
+    countries_in_continent = set()
+    for dataframe in dataframes:
+        countries_in_continent.update(filter_by_continent(dataframe, selected_continent)["country"].unique())
+    return sorted(countries_in_continent)
+
+class MemoryCacheBackend:
+    """Process-local cache backend: a bounded LRU.
+
+    Any object with the same `get(key, default)` / `put(key, value)` methods
+    can be plugged into `DataEngine` instead.
+    """
+
+    def __init__(self, max_entries: int = 16):
+        self._cache = LRUCache(max_entries)
+
+    def get(self, key, default=None):
+        return self._cache.get(key, default)
+
+    def put(self, key, value):
+        self._cache.put(key, value)
+
+def _build_dataset_cache(file_mapping: dict, cache_dir: str) -> str:
+    enable_copy_on_write()
+    key, _ = dc.build_dataset(file_mapping, build_merged_dataset, cache_dir, BUILD_INPUTS)
+    return key
+
+class DataEngine:
+    """Loads the merged dataset and the structures derived from it, caching both in `backend`.
+
+    Derived structures (index, metadata, correlation blocks, pivots) are keyed by the
+    dataset fingerprint, so every consumer of the same dataset version shares
+    one copy. Frames without a fingerprint are processed uncached.
+    """
+
+    def __init__(self, file_mapping: dict = FILE_MAPPING, backend=None, on_warning=logger.warning,
+                 cache_dir: str = dc.CACHE_DIR):
+        self.file_mapping = file_mapping
+        self.backend = backend if backend is not None else MemoryCacheBackend()
+        self.on_warning = on_warning
+        self.cache_dir = cache_dir
+        # Rollups of attribute-filtered datasets, apart from `backend` so that
+        # dragging a slider never evicts the dataset and its structures.
+        self.filtered_rollups = LRUCache(4)
+
+    def build(self, file_mapping: dict) -> pd.DataFrame:
+        return build_merged_dataset(file_mapping, self.on_warning)
+
+    def load_dataset(self, out_of_process: bool = False) -> pd.DataFrame:
+        """The merged dataset for the current source files.
+
+        With `out_of_process`, a missing Arrow cache file is built in a spawned
+        worker process and then memory-mapped here, so the merge's temporary
+        allocations never touch this process.
+        """
+        key = dc.current_key(self.file_mapping, self.cache_dir, BUILD_INPUTS)
+        dataframe = self.backend.get(("dataset", key))
+        if dataframe is not None:
+            self.pivots(dataframe)
+            return dataframe
+
+        if out_of_process and not os.path.exists(dc.cache_path(key, self.cache_dir)):
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                pool.submit(_build_dataset_cache, self.file_mapping, self.cache_dir).result()
+
+        dataframe = dc.load_or_build(self.file_mapping, self.build, self.cache_dir, BUILD_INPUTS)
+        self.backend.put(("dataset", dataframe.attrs["fingerprint"]), dataframe)
+        self.pivots(dataframe)
+        return dataframe
+
+    def _derived(self, kind: str, builder, dataframe: pd.DataFrame):
+        dataset_key = dataframe.attrs.get("fingerprint")
+        if dataset_key is None:
+            return builder(dataframe)
+        value = self.backend.get((kind, dataset_key))
+        if value is None:
+            value = builder(dataframe)
+            self.backend.put((kind, dataset_key), value)
+        return value
+
+    def dataset_index(self, dataframe: pd.DataFrame) -> DatasetIndex:
+        """Sorted indexes of a loaded dataset, built once per dataset version."""
+        return self._derived("index", DatasetIndex, dataframe)
+
+    def dataset_metadata(self, dataframe: pd.DataFrame) -> DatasetMetadata:
+        """Column bounds and unique values of a loaded dataset, computed once per dataset version."""
+        return self._derived("metadata", DatasetMetadata, dataframe)
+
+    def correlation_engine(self, dataframe: pd.DataFrame) -> CorrelationEngine:
+        """Block correlation statistics of a loaded dataset, built once per dataset version."""
+        return self._derived("correlation", CorrelationEngine, dataframe)
+
+    def rollups(self, dataframe: pd.DataFrame, predicates: tuple = ()) -> RollupStore:
+        """Per-country, continent and world prefix sums of a loaded dataset, built once per dataset version.
+
+        With `predicates` (attribute filters such as the CO₂ slider) the store
+        only covers the rows they keep; it is built once per predicate set.
+        """
+        if not predicates:
+            return self._derived("rollups", RollupStore, dataframe)
+        key = (dataframe.attrs.get("fingerprint"), tuple(predicates))
+        store = self.filtered_rollups.get(key) if key[0] is not None else None
+        if store is None:
+            store = RollupStore(dataframe.iloc[fe.select_rows(dataframe, predicates, self.dataset_index(dataframe))])
+            if key[0] is not None:
+                self.filtered_rollups.put(key, store)
+        return store
+
+    def pivots(self, dataframe: pd.DataFrame) -> PivotStore:
+        """Country x year matrices of a loaded dataset, built once per dataset version.
+
+        The store is also registered under the dataset fingerprint, where
+        `pv.for_frame` finds it for any row selection of the dataset.
+        """
+        return pv.register(self._derived("pivots", PivotStore, dataframe))
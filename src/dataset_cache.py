@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import src.pivots as pv
+
+CACHE_DIR = "data/.cache"
+MANIFEST_NAME = "manifest.json"
+
+# Bump whenever the build output changes shape or dtypes so old cache files are ignored.
+CACHE_FORMAT_VERSION = 3
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _read_manifest(cache_dir: str) -> dict:
+    try:
+        with open(os.path.join(cache_dir, MANIFEST_NAME)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+def _write_manifest(cache_dir: str, manifest: dict):
+    path = os.path.join(cache_dir, MANIFEST_NAME)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def source_fingerprints(file_mapping: dict, known: dict = None) -> dict:
+    """Fingerprint every source file by size, mtime and content hash.
+
+    Files whose size and mtime match an entry in `known` reuse its hash, so an
+    unchanged tree costs one stat() per file instead of a full read.
+    """
+    known = known or {}
+    fingerprints = {}
+    for name, path in file_mapping.items():
+        stat = os.stat(path)
+        previous = known.get(name, {})
+        if (previous.get("path") == path
+                and previous.get("size") == stat.st_size
+                and previous.get("mtime_ns") == stat.st_mtime_ns):
+            sha256 = previous["sha256"]
+        else:
+            sha256 = _hash_file(path)
+        fingerprints[name] = {"path": path, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}
+    return fingerprints
+
+def tracked_files(file_mapping: dict, build_inputs: tuple = ()) -> dict:
+    """The source files plus the other files the build reads (continent index, indicator registry).
+
+    Build inputs that do not exist yet are left out; the build creates them.
+    """
+    inputs = {f"input:{path}": path for path in build_inputs if os.path.exists(path)}
+    return {**file_mapping, **inputs}
+
+def dataset_key(fingerprints: dict) -> str:
+    """Combine source and build input content hashes into the key of the merged dataset."""
+    payload = json.dumps(
+        {"version": CACHE_FORMAT_VERSION, "sources": {name: fp["sha256"] for name, fp in fingerprints.items()}},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def selection_fingerprint(dataframe: pd.DataFrame) -> str:
+    """Identify a row selection of a cached dataset by its version and row positions.
+
+    Frames that are not a selection of a loaded dataset carry no version,
+    and a selection's labels stop being its row positions once its index is
+    reset, so the values of such frames are hashed instead.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    fingerprint = dataframe.attrs.get("fingerprint")
+    digest.update(str(fingerprint).encode())
+    digest.update(",".join(map(str, dataframe.columns)).encode())
+    digest.update(pd.util.hash_array(dataframe.index.to_numpy()).tobytes())
+    if fingerprint is None or pv.row_positions(dataframe) is None:
+        digest.update(pd.util.hash_pandas_object(dataframe, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def group_fingerprints(dataframe: pd.DataFrame, groups: list, columns: list, column: str = "country") -> dict:
+    """Identify the rows of each of `groups` (values of `column`) on their own.
+
+    Rows of a selection of a loaded dataset are identified by the dataset
+    version and their row positions in it; rows of other frames by their
+    values in `columns`. A group's fingerprint only changes when its own rows
+    do, not when other groups join or leave the selection.
+    """
+    rows = dataframe.groupby(column, observed=True, sort=False).indices
+    positions = pv.row_positions(dataframe) if dataframe.attrs.get("fingerprint") is not None else None
+    fingerprints = {}
+    for group in groups:
+        group_rows = rows.get(group, np.empty(0, dtype=np.intp))
+        digest = hashlib.blake2b(digest_size=16)
+        if positions is not None:
+            digest.update(str(dataframe.attrs["fingerprint"]).encode())
+            digest.update(positions[group_rows].tobytes())
+        else:
+            digest.update(pd.util.hash_pandas_object(dataframe.iloc[group_rows][list(columns)], index=False).to_numpy().tobytes())
+        fingerprints[group] = digest.hexdigest()
+    return fingerprints
+
+def cache_path(key: str, cache_dir: str = CACHE_DIR) -> str:
+    return os.path.join(cache_dir, f"merged-{key[:16]}.feather")
+
+def current_key(file_mapping: dict, cache_dir: str = CACHE_DIR, build_inputs: tuple = ()) -> str:
+    return dataset_key(source_fingerprints(tracked_files(file_mapping, build_inputs), _read_manifest(cache_dir).get("sources")))
+
+def read_dataset(path: str) -> pd.DataFrame:
+    """Load a cached dataset through a memory map of the Arrow file."""
+    table = feather.read_table(path, memory_map=True)
+    return table.to_pandas(split_blocks=True)
+
+def write_dataset(dataframe: pd.DataFrame, path: str):
+    """Write the dataset atomically as an uncompressed Arrow file.
+
+    Float columns keep NaN as a value instead of an Arrow null, so reading
+    them back through a memory map needs no copy; every process reading the
+    file shares the same page-cache pages.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    table = pa.Table.from_pandas(dataframe, preserve_index=False)
+    for position, column in enumerate(dataframe.columns):
+        if dataframe[column].dtype.kind == "f":
+            values = pa.array(dataframe[column].to_numpy(), from_pandas=False)
+            table = table.set_column(position, table.field(position), values)
+    feather.write_feather(table, tmp_path, compression="uncompressed")
+    os.replace(tmp_path, path)
+
+def build_dataset(file_mapping: dict, build, cache_dir: str = CACHE_DIR, build_inputs: tuple = ()) -> tuple[str, pd.DataFrame]:
+    """Run `build(file_mapping)` and store its result under the current source fingerprint.
+
+    The fingerprint is taken after the build, which may extend the continent index.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    dataframe = build(file_mapping).reset_index(drop=True)
+
+    fingerprints = source_fingerprints(tracked_files(file_mapping, build_inputs), _read_manifest(cache_dir).get("sources"))
+    key = dataset_key(fingerprints)
+    path = cache_path(key, cache_dir)
+    write_dataset(dataframe, path)
+
+    for name in os.listdir(cache_dir):
+        if name.startswith("merged-") and name.endswith(".feather") and name != os.path.basename(path):
+            os.remove(os.path.join(cache_dir, name))
+    _write_manifest(cache_dir, {"key": key, "sources": fingerprints})
+
+    return key, dataframe
+
+def load_or_build(file_mapping: dict, build, cache_dir: str = CACHE_DIR, build_inputs: tuple = ()) -> pd.DataFrame:
+    """Return the merged dataset, rebuilding it only when a source file or build input changed."""
+    manifest = _read_manifest(cache_dir)
+    fingerprints = source_fingerprints(tracked_files(file_mapping, build_inputs), manifest.get("sources"))
+    key = dataset_key(fingerprints)
+    path = cache_path(key, cache_dir)
+
+    if os.path.exists(path):
+        dataframe = read_dataset(path)
+        if manifest.get("sources") != fingerprints:
+            _write_manifest(cache_dir, {"key": key, "sources": fingerprints})
+    else:
+        key, dataframe = build_dataset(file_mapping, build, cache_dir, build_inputs)
+
+    dataframe.attrs["fingerprint"] = key
+    return dataframe
+
+def main(argv: list = None):
+    """Build the dataset cache ahead of time: python -m src.dataset_cache"""
+    import src.data_engine as de
+
+    argv = sys.argv[1:] if argv is None else argv
+    cache_dir = argv[0] if argv else CACHE_DIR
+    key, dataframe = build_dataset(de.FILE_MAPPING, de.build_merged_dataset, cache_dir, de.BUILD_INPUTS)
+    print(f"Wrote {len(dataframe)} rows to {cache_path(key, cache_dir)}")
+
+if __name__ == "__main__":
+    main()
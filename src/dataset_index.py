@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+from src.filter_engine import RangePredicate, SetPredicate
+
+class DatasetIndex:
+    """Sorted per-column indexes over one version of the merged dataset.
+
+    Numeric columns keep an argsort permutation of their non-missing rows, so a
+    range predicate resolves to a contiguous slice of it with `searchsorted`.
+    Categorical columns (country, continent) keep CSR-style offsets into a row
+    list grouped by category. `select` resolves the most selective predicate
+    through the index and checks the others only on its candidate rows, so the
+    cost follows the size of the result rather than the size of the table.
+    """
+
+    def __init__(self, dataframe: pd.DataFrame):
+        self.row_count = len(dataframe)
+        self.values = {}
+        self.sorted_rows = {}
+        self.sorted_values = {}
+        self.category_codes = {}
+        self.categories = {}
+        self.category_rows = {}
+        self.category_offsets = {}
+        self._ranks = {}
+
+        for column in dataframe.columns:
+            series = dataframe[column]
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                codes = series.cat.codes.to_numpy()
+                rows = np.argsort(codes, kind="stable")
+                rows = rows[codes[rows] >= 0]
+                self.category_codes[column] = codes
+                self.categories[column] = {category: code for code, category in enumerate(series.cat.categories)}
+                self.category_rows[column] = rows
+                self.category_offsets[column] = np.searchsorted(
+                    codes[rows], np.arange(len(series.cat.categories) + 1)
+                )
+            elif pd.api.types.is_numeric_dtype(series.dtype):
+                values = series.to_numpy()
+                rows = np.argsort(values, kind="stable")
+                rows = rows[~np.isnan(values[rows])] if values.dtype.kind == "f" else rows
+                self.values[column] = values
+                self.sorted_rows[column] = rows
+                self.sorted_values[column] = values[rows]
+
+    def _range_bounds(self, predicate: RangePredicate) -> tuple[int, int]:
+        sorted_values = self.sorted_values[predicate.column]
+        return (
+            np.searchsorted(sorted_values, predicate.low, side="left"),
+            np.searchsorted(sorted_values, predicate.high, side="right"),
+        )
+
+    def _category_positions(self, predicate: SetPredicate) -> np.ndarray:
+        lookup = self.categories[predicate.column]
+        return np.array([lookup[value] for value in predicate.values if value in lookup], dtype=np.intp)
+
+    def supports(self, predicate) -> bool:
+        if isinstance(predicate, RangePredicate):
+            return predicate.column in self.sorted_rows
+        if isinstance(predicate, SetPredicate):
+            return predicate.column in self.category_rows
+        return False
+
+    def estimate(self, predicate) -> int:
+        """Number of rows the index would return for `predicate`."""
+        if isinstance(predicate, RangePredicate):
+            start, stop = self._range_bounds(predicate)
+            return max(stop - start, 0)
+        offsets = self.category_offsets[predicate.column]
+        positions = self._category_positions(predicate)
+        return int((offsets[positions + 1] - offsets[positions]).sum())
+
+    def rows(self, predicate) -> np.ndarray:
+        """Row positions matching a single indexed predicate, in no particular order."""
+        if isinstance(predicate, RangePredicate):
+            start, stop = self._range_bounds(predicate)
+            return self.sorted_rows[predicate.column][start:max(start, stop)]
+        rows = self.category_rows[predicate.column]
+        offsets = self.category_offsets[predicate.column]
+        return np.concatenate(
+            [rows[offsets[position]:offsets[position + 1]] for position in self._category_positions(predicate)]
+            or [np.empty(0, dtype=np.intp)]
+        )
+
+    def matches(self, predicate, rows: np.ndarray) -> np.ndarray:
+        """Evaluate an indexed predicate on candidate rows only."""
+        if isinstance(predicate, RangePredicate):
+            values = self.values[predicate.column][rows]
+            with np.errstate(invalid="ignore"):
+                return (values >= predicate.low) & (values <= predicate.high)
+        return np.isin(self.category_codes[predicate.column][rows], self._category_positions(predicate))
+
+    def select(self, predicates: list) -> np.ndarray:
+        """Sorted row positions matching every predicate."""
+        if not predicates:
+            return np.arange(self.row_count)
+        if not all(self.supports(predicate) for predicate in predicates):
+            raise KeyError("DatasetIndex has no index for some of the predicate columns")
+
+        ordered = sorted(predicates, key=self.estimate)
+        candidates = self.rows(ordered[0])
+        for predicate in ordered[1:]:
+            if len(candidates) == 0:
+                break
+            candidates = candidates[self.matches(predicate, candidates)]
+
+        return np.sort(candidates)
+
+    def rank(self, column: str) -> np.ndarray:
+        """Sort rank of every row by `column`; missing values rank last."""
+        if column not in self._ranks:
+            if column in self.category_codes:
+                codes = self.category_codes[column].astype(np.int64)
+                ranks = np.where(codes >= 0, codes, np.iinfo(np.int64).max)
+            else:
+                ranks = np.full(self.row_count, np.iinfo(np.int64).max, dtype=np.int64)
+                ranks[self.sorted_rows[column]] = np.arange(len(self.sorted_rows[column]))
+            self._ranks[column] = ranks
+        return self._ranks[column]
+
+    def sort_rows(self, rows: np.ndarray, column: str, ascending: bool = True) -> np.ndarray:
+        """Order a row selection by `column` using the precomputed ranks, missing values last."""
+        ranks = self.rank(column)[rows]
+        if not ascending:
+            missing = ranks == np.iinfo(np.int64).max
+            ranks = np.where(missing, ranks, -ranks)
+        return rows[np.argsort(ranks, kind="stable")]
@@ -0,0 +1,41 @@
+import pandas as pd
+
+QUANTILES = (0.02, 0.25, 0.5, 0.75, 0.98)
+
+class DatasetMetadata:
+    """Per-column bounds and the unique-value lists the widgets are built from.
+
+    Computed once per dataset version, so sidebar reruns read ready-made
+    values instead of reducing full columns.
+    """
+
+    def __init__(self, dataframe: pd.DataFrame, quantiles: tuple = QUANTILES):
+        self.row_count = len(dataframe)
+        self.minimums = {}
+        self.maximums = {}
+        self.quantiles = {}
+
+        for column in dataframe.select_dtypes(include="number").columns:
+            series = dataframe[column]
+            self.minimums[column] = series.min()
+            self.maximums[column] = series.max()
+            self.quantiles[column] = dict(zip(quantiles, series.quantile(list(quantiles)).tolist()))
+
+        self.countries = sorted(dataframe["country"].dropna().unique())
+        self.years = sorted(int(year) for year in dataframe["year"].dropna().unique())
+
+        self.continent_countries = {}
+        if "continent" in dataframe.columns:
+            pairs = dataframe[["continent", "country"]].dropna().drop_duplicates()
+            for continent, countries in pairs.groupby("continent", observed=True)["country"]:
+                self.continent_countries[continent] = sorted(countries)
+        self.continents = sorted(self.continent_countries)
+
+    def column_range(self, column: str) -> tuple:
+        return self.minimums[column], self.maximums[column]
+
+    def quantile(self, column: str, q: float) -> float:
+        return self.quantiles[column][q]
+
+    def countries_in(self, continent: str) -> list:
+        return self.continent_countries.get(continent, [])
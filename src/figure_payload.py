@@ -0,0 +1,245 @@
+import logging
+import os
+import numpy as np
+import plotly.graph_objects as go
+import plotly.io as pio
+import src.profiler as prof
+
+logger = logging.getLogger(__name__)
+
+PAYLOAD_BUDGET_BYTES = int(os.environ.get("CO2_PLOTLY_BUDGET_BYTES", 3_000_000))
+SIGNIFICANT_DIGITS = 4
+NUMERIC_ATTRIBUTES = ("x", "y", "z")
+TEXT_ATTRIBUTES = ("hovertext", "text")
+MAX_DECIMATION_ROUNDS = 6
+CHART_WIDTH_PX = int(os.environ.get("CO2_CHART_WIDTH_PX", 700))
+LINE_POINTS_PER_PIXEL = 0.25
+WEBGL_POINT_THRESHOLD = 1000
+
+def round_significant(values: np.ndarray, digits: int = SIGNIFICANT_DIGITS) -> np.ndarray:
+    """Round floats to `digits` significant digits, leaving zeros and NaN untouched."""
+    values = np.asarray(values, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        magnitude = np.floor(np.log10(np.abs(values)))
+        scale = np.power(10.0, digits - 1 - np.where(np.isfinite(magnitude), magnitude, 0))
+        return np.round(values * scale) / scale
+
+def compact_array(values):
+    """Convert a numeric trace array to the smallest dtype that keeps display precision.
+
+    Plotly >= 6 sends NumPy arrays to the browser as base64 typed arrays, so the
+    dtype chosen here is what goes over the wire; older versions fall back to
+    JSON numbers, which still shrink from the rounding.
+    """
+    if values is None or isinstance(values, (str, dict)):
+        return values
+    array = np.asarray(values)
+    if array.ndim == 0 or array.dtype.kind not in "iuf" or array.size == 0:
+        return values
+    if array.dtype.kind in "iu":
+        if array.min() >= np.iinfo(np.int16).min and array.max() <= np.iinfo(np.int16).max:
+            return array.astype(np.int16)
+        return array.astype(np.int32)
+    return round_significant(array).astype(np.float32)
+
+def _dedupe_text(trace):
+    for attribute in TEXT_ATTRIBUTES:
+        values = getattr(trace, attribute, None)
+        if values is None or isinstance(values, str):
+            continue
+        values = list(values)
+        if not values:
+            continue
+        if len(set(values)) == 1:
+            trace[attribute] = values[0]
+        elif attribute == "hovertext" and "locations" in trace and list(trace.locations) == values:
+            trace.hovertext = None
+            if trace.hovertemplate:
+                trace.hovertemplate = trace.hovertemplate.replace("%{hovertext}", "%{location}")
+
+def _traces(figure):
+    yield from figure.data
+    for frame in figure.frames or ():
+        yield from frame.data or ()
+
+def compact_figure(figure):
+    """Shrink every trace of the figure (and of its animation frames) in place."""
+    for trace in _traces(figure):
+        for attribute in NUMERIC_ATTRIBUTES:
+            if attribute in trace and trace[attribute] is not None:
+                trace[attribute] = compact_array(trace[attribute])
+        _dedupe_text(trace)
+    return figure
+
+def payload_size(figure) -> int:
+    return len(pio.to_json(figure, validate=False))
+
+def _decimate_trace(trace) -> bool:
+    lengths = [len(trace[attribute]) for attribute in ("x", "y") if attribute in trace and trace[attribute] is not None
+               and not isinstance(trace[attribute], str)]
+    if not lengths or min(lengths) < 4:
+        return False
+    keep = np.unique(np.append(np.arange(0, min(lengths), 2), min(lengths) - 1))
+    _take(trace, keep, min(lengths))
+    return True
+
+def lttb_indices(xs: list, ys: list, threshold: int) -> list:
+    """Indices of the points largest-triangle-three-buckets keeps of each (x, y) series.
+
+    Series longer than `threshold` keep their first and last point plus one
+    point per bucket of the points in between: the one spanning the largest
+    triangle with the point kept from the previous bucket and the mean of the
+    next bucket. All long series step through their buckets together, so the
+    cost is one loop over `threshold` buckets whatever the number of series.
+    x must be sorted and both finite.
+    """
+    lengths = np.array([len(x) for x in xs], dtype=np.int64)
+    kept = [np.arange(length) for length in lengths]
+    long = np.flatnonzero(lengths > threshold)
+    if threshold < 3 or not len(long):
+        return kept
+
+    counts = lengths[long]
+    offsets = np.r_[0, np.cumsum(counts)[:-1]]
+    x = np.concatenate([np.asarray(xs[i], dtype=np.float64) for i in long])
+    y = np.concatenate([np.asarray(ys[i], dtype=np.float64) for i in long])
+    last = offsets + counts - 1
+
+    # Bucket k spans edges[:, k] up to edges[:, k + 1], over the points between the first and last.
+    buckets = threshold - 2
+    edges = offsets[:, None] + 1 + (np.arange(buckets + 1) * (counts[:, None] - 2)) // buckets
+    sizes = np.diff(edges, axis=1)
+    x_sums, y_sums = np.r_[0, np.cumsum(x)], np.r_[0, np.cumsum(y)]
+    next_x = np.c_[((x_sums[edges[:, 1:]] - x_sums[edges[:, :-1]]) / sizes)[:, 1:], x[last]]
+    next_y = np.c_[((y_sums[edges[:, 1:]] - y_sums[edges[:, :-1]]) / sizes)[:, 1:], y[last]]
+
+    rows = np.arange(len(long))
+    slots = np.arange(sizes.max())
+    selected = np.empty((len(long), threshold), dtype=np.int64)
+    selected[:, 0], selected[:, -1] = offsets, last
+    for bucket in range(buckets):
+        candidates = edges[:, bucket, None] + slots
+        valid = candidates < edges[:, bucket + 1, None]
+        candidates = np.where(valid, candidates, edges[:, bucket, None])
+        previous = selected[:, bucket]
+        area = np.abs(
+            (x[previous] - next_x[:, bucket])[:, None] * (y[candidates] - y[previous][:, None])
+            - (x[previous][:, None] - x[candidates]) * (next_y[:, bucket] - y[previous])[:, None]
+        )
+        selected[:, bucket + 1] = candidates[rows, np.where(valid, area, -1).argmax(axis=1)]
+
+    for row, i in enumerate(long):
+        kept[i] = selected[row] - offsets[row]
+    return kept
+
+def _take(trace, keep: np.ndarray, length: int):
+    for attribute in ("x", "y", "hovertext", "text", "customdata"):
+        values = trace[attribute] if attribute in trace else None
+        if values is not None and not isinstance(values, str) and len(values) == length:
+            trace[attribute] = np.asarray(values)[keep]
+
+def _line_points(trace, log_y: bool):
+    """Display-space (x, y) of a line trace LTTB can reduce, or None."""
+    if trace.type not in ("scatter", "scattergl") or "lines" not in (trace.mode or "lines"):
+        return None
+    if trace.fill not in (None, "none") or trace.x is None or trace.y is None or len(trace.x) != len(trace.y):
+        return None
+    try:
+        x = np.asarray(trace.x, dtype=np.float64)
+        y = np.asarray(trace.y, dtype=np.float64)
+    except (TypeError, ValueError):
+        return None
+    if log_y:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            y = np.log10(y)
+    return x, y
+
+def downsample_lines(figure, width: int = None) -> int:
+    """LTTB-downsample the line traces of a figure to a point budget set by its width.
+
+    Each series keeps about LINE_POINTS_PER_PIXEL points per pixel of
+    `width` (the layout width, else CHART_WIDTH_PX); yearly points closer
+    than that are indistinguishable on a line. Shapes are judged on the
+    displayed scale, and missing values are kept so gaps stay gaps. Returns
+    the number of points left in scatter traces.
+    """
+    width = width or figure.layout.width or CHART_WIDTH_PX
+    threshold = max(int(width * LINE_POINTS_PER_PIXEL), 3)
+    log_y = figure.layout.yaxis.type == "log"
+
+    lines = []
+    for trace in figure.data:
+        points = _line_points(trace, log_y)
+        if points is not None and len(points[0]) > threshold:
+            x, y = points
+            finite = np.isfinite(x) & np.isfinite(y)
+            if (np.diff(x[finite]) >= 0).all():
+                lines.append((trace, finite, x[finite], y[finite]))
+
+    kept = lttb_indices([x for *_, x, _ in lines], [y for *_, y in lines], threshold)
+    for (trace, finite, _, _), keep in zip(lines, kept):
+        positions = np.flatnonzero(finite)
+        _take(trace, np.sort(np.r_[positions[keep], np.flatnonzero(~finite)]), len(finite))
+
+    return sum(
+        len(trace.x) for trace in figure.data
+        if trace.type in ("scatter", "scattergl") and trace.x is not None and not isinstance(trace.x, str)
+    )
+
+def use_webgl(figure):
+    """Swap the figure's SVG scatter traces for their WebGL (Scattergl) equivalents."""
+    traces = [
+        go.Scattergl(trace.to_plotly_json() | {"type": "scattergl"}) if trace.type == "scatter" else trace
+        for trace in figure.data
+    ]
+    figure.data = []
+    figure.add_traces(traces)
+    return figure
+
+def decimate_figure(figure) -> bool:
+    """Halve the point count of long traces and the number of animation frames.
+
+    Returns False when nothing was left to reduce.
+    """
+    reduced = False
+    if figure.frames and len(figure.frames) > 2:
+        frames = list(figure.frames)
+        kept = frames[::2] if (len(frames) - 1) % 2 == 0 else frames[::2] + [frames[-1]]
+        names = {frame.name for frame in kept}
+        figure.frames = kept
+        for slider in figure.layout.sliders or ():
+            slider.steps = [step for step in slider.steps if step.args and step.args[0][0] in names]
+        reduced = True
+    for trace in figure.data:
+        if trace.type in ("scatter", "scattergl"):
+            reduced = _decimate_trace(trace) or reduced
+    return reduced
+
+def prepare_figure(figure, budget: int = PAYLOAD_BUDGET_BYTES, name: str = None):
+    """Compact a figure and decimate it until its JSON payload fits within `budget` bytes.
+
+    Long line traces are first LTTB-downsampled to the chart width, and
+    figures still holding more than WEBGL_POINT_THRESHOLD scatter points are
+    drawn with WebGL.
+    """
+    name = name or figure.layout.title.text or "figure"
+    with prof.stage(f"prepare_figure:{name}") as record:
+        if downsample_lines(figure) > WEBGL_POINT_THRESHOLD:
+            use_webgl(figure)
+        compact_figure(figure)
+        size = payload_size(figure)
+        rounds = 0
+        while budget and size > budget and rounds < MAX_DECIMATION_ROUNDS and decimate_figure(figure):
+            size = payload_size(figure)
+            rounds += 1
+        if record is not None:
+            record.payload_bytes = size
+
+    logger.info("Plotly payload for %r: %d bytes (%d decimation rounds)", name, size, rounds)
+    return figure
+
+def plotly_chart(figure, budget: int = PAYLOAD_BUDGET_BYTES, **kwargs):
+    """Drop-in replacement for st.plotly_chart that sends a compacted, budgeted figure."""
+    import streamlit as st
+
+    return st.plotly_chart(prepare_figure(figure, budget, kwargs.get("key")), **kwargs)
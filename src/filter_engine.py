@@ -0,0 +1,57 @@
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+
+@dataclass(frozen=True)
+class RangePredicate:
+    """Keep rows where `low <= column <= high`. Missing values never match."""
+    column: str
+    low: float
+    high: float
+
+@dataclass(frozen=True)
+class SetPredicate:
+    """Keep rows where `column` is one of `values`."""
+    column: str
+    values: tuple
+
+def _range_mask(series: pd.Series, predicate: RangePredicate, out: np.ndarray):
+    values = series.to_numpy()
+    with np.errstate(invalid="ignore"):
+        out &= values >= predicate.low
+        out &= values <= predicate.high
+
+def _set_mask(series: pd.Series, predicate: SetPredicate, out: np.ndarray):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        wanted = series.cat.categories.get_indexer(list(predicate.values))
+        out &= np.isin(series.cat.codes.to_numpy(), wanted[wanted >= 0])
+    else:
+        out &= series.isin(predicate.values).to_numpy()
+
+def build_mask(dataframe: pd.DataFrame, predicates: list) -> np.ndarray:
+    """Combine every predicate into a single boolean mask over the frame's rows."""
+    mask = np.ones(len(dataframe), dtype=bool)
+    for predicate in predicates:
+        series = dataframe[predicate.column]
+        if isinstance(predicate, RangePredicate):
+            _range_mask(series, predicate, mask)
+        elif isinstance(predicate, SetPredicate):
+            _set_mask(series, predicate, mask)
+        else:
+            raise TypeError(f"Unsupported predicate: {predicate!r}")
+    return mask
+
+def select_rows(dataframe: pd.DataFrame, predicates: list, index=None) -> np.ndarray:
+    """Return the positions of the rows matching all predicates.
+
+    When a `DatasetIndex` built for this frame is given and covers every
+    predicate, the rows are resolved through it instead of a full-column scan.
+    """
+    if index is not None and index.row_count == len(dataframe) and all(index.supports(p) for p in predicates):
+        return index.select(predicates)
+    return np.flatnonzero(build_mask(dataframe, predicates))
+
+def apply_filters(dataframe: pd.DataFrame, predicates: list, index=None) -> tuple[pd.DataFrame, np.ndarray]:
+    """Slice the frame once for all predicates, returning the slice and its row positions."""
+    rows = select_rows(dataframe, predicates, index)
+    return dataframe.iloc[rows], rows
@@ -0,0 +1,234 @@
+from dataclasses import dataclass
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from repoze.lru import LRUCache
+from scipy import stats
+import src.dataset_cache as dc
+import src.pivots as pv
+
+INTERVAL_LEVEL = 0.95
+
+forecast_cache = LRUCache(1024)
+_MISSING = object()
+
+@dataclass
+class GroupedSeries:
+    """Per-country (year, value) series packed into padded matrices.
+
+    Row i holds the series of `countries[i]`; `mask` marks the real points,
+    padding cells are zero.
+    """
+    countries: list
+    years: np.ndarray
+    values: np.ndarray
+    mask: np.ndarray
+
+    def series(self, position: int) -> tuple[np.ndarray, np.ndarray]:
+        valid = self.mask[position]
+        return self.years[position, valid], self.values[position, valid]
+
+@dataclass
+class CountryForecast:
+    country: str
+    years: np.ndarray
+    values: np.ndarray
+    future_years: np.ndarray
+    predictions: np.ndarray
+    lower: np.ndarray = None
+    upper: np.ndarray = None
+
+@dataclass
+class BatchForecast:
+    countries: list
+    future_years: np.ndarray
+    predictions: np.ndarray
+    coefficients: np.ndarray
+    lower: np.ndarray = None
+    upper: np.ndarray = None
+
+@dataclass
+class PolynomialFit:
+    """Batched polynomial fit, with what its prediction intervals need.
+
+    `covariance` holds each country's unscaled coefficient covariance, which
+    is (XᵀX)⁻¹ for least squares. `residual_variance` is σ² over `dof`
+    residual degrees of freedom (NaN without any).
+    """
+    coefficients: np.ndarray
+    center: np.ndarray
+    spread: np.ndarray
+    covariance: np.ndarray
+    residual_variance: np.ndarray
+    dof: np.ndarray
+
+def _pivot_series(store: pv.PivotStore, dataframe: pd.DataFrame, countries: list, target_column: str) -> GroupedSeries:
+    ordered_countries = list(dict.fromkeys(countries))
+    years, values, mask = store.block(target_column, ordered_countries, dataframe)
+    mask &= ~np.isnan(values)
+    present = np.flatnonzero(mask.any(axis=1))
+    mask = mask[present]
+    # Move each row's points to its front, keeping their year order.
+    order = np.argsort(~mask, axis=1, kind="stable")[:, :mask.sum(axis=1).max(initial=0)]
+    mask = np.take_along_axis(mask, order, axis=1)
+    year_matrix = np.where(mask, years[order], 0).astype(np.float64)
+    value_matrix = np.where(mask, np.take_along_axis(values[present], order, axis=1), 0).astype(np.float64)
+    return GroupedSeries([ordered_countries[code] for code in present], year_matrix, value_matrix, mask)
+
+def group_series(dataframe: pd.DataFrame, countries: list, target_column: str) -> GroupedSeries:
+    """Group the non-missing (year, target) points of the selected countries in one pass.
+
+    Selections of a loaded dataset are sliced out of its country x year
+    matrices; other frames are grouped from their rows.
+    """
+    store = pv.for_frame(dataframe, target_column)
+    if store is not None:
+        return _pivot_series(store, dataframe, countries, target_column)
+
+    data = dataframe.loc[dataframe["country"].isin(countries), ["country", "year", target_column]].dropna()
+    codes = pd.Categorical(data["country"], categories=list(dict.fromkeys(countries))).codes
+    order = np.lexsort((data["year"].to_numpy(), codes))
+    codes = codes[order]
+    years = data["year"].to_numpy(dtype=np.float64)[order]
+    values = data[target_column].to_numpy(dtype=np.float64)[order]
+
+    present, starts, counts = np.unique(codes, return_index=True, return_counts=True)
+    width = counts.max() if len(counts) else 0
+    slots = np.arange(len(codes)) - np.repeat(starts, counts)
+    rows = np.repeat(np.arange(len(present)), counts)
+
+    year_matrix = np.zeros((len(present), width))
+    value_matrix = np.zeros((len(present), width))
+    mask = np.zeros((len(present), width), dtype=bool)
+    year_matrix[rows, slots] = years
+    value_matrix[rows, slots] = values
+    mask[rows, slots] = True
+
+    ordered_countries = list(dict.fromkeys(countries))
+    return GroupedSeries([ordered_countries[code] for code in present], year_matrix, value_matrix, mask)
+
+def _scale(series: GroupedSeries) -> tuple[np.ndarray, np.ndarray]:
+    counts = series.mask.sum(axis=1)
+    center = (series.years * series.mask).sum(axis=1) / counts
+    spread = np.where(series.mask, np.abs(series.years - center[:, None]), 0).max(axis=1)
+    return center, np.where(spread > 0, spread, 1.0)
+
+def _vandermonde(x: np.ndarray, degree: int) -> np.ndarray:
+    return x[..., None] ** np.arange(degree + 1)
+
+def fit_polynomials(series: GroupedSeries, degree: int, ridge_alpha: float = 0.0) -> PolynomialFit:
+    """Least-squares polynomial fit of every country at once.
+
+    Years are centred and scaled per country before building the stacked
+    Vandermonde matrices, which keeps degree-4 fits well conditioned without
+    changing the fitted curve. Padding rows are zeroed so they drop out of the
+    batched pseudo-inverse solve. With `ridge_alpha` the non-constant
+    coefficients are shrunk by an L2 penalty (on the scaled years).
+    """
+    center, spread = _scale(series)
+    x = (series.years - center[:, None]) / spread[:, None]
+    design = _vandermonde(x, degree) * series.mask[..., None]
+    targets = series.values * series.mask
+    if ridge_alpha > 0:
+        gram = design.transpose(0, 2, 1) @ design
+        gram_inverse = np.linalg.inv(gram + ridge_alpha * np.diag(np.r_[0.0, np.ones(degree)]))
+        coefficients = np.einsum("ckj,cnj,cn->ck", gram_inverse, design, targets)
+        covariance = gram_inverse @ gram @ gram_inverse
+    else:
+        pseudo_inverse = np.linalg.pinv(design)
+        coefficients = np.einsum("ckn,cn->ck", pseudo_inverse, targets)
+        # X⁺X⁺ᵀ = (XᵀX)⁻¹, so the solve already holds the coefficient covariance.
+        covariance = pseudo_inverse @ pseudo_inverse.transpose(0, 2, 1)
+
+    residuals = ((design @ coefficients[..., None])[..., 0] - targets) * series.mask
+    dof = series.mask.sum(axis=1) - (degree + 1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        residual_variance = np.where(dof > 0, (residuals ** 2).sum(axis=1) / dof, np.nan)
+    return PolynomialFit(coefficients, center, spread, covariance, residual_variance, dof)
+
+def batch_polynomial_fit(series: GroupedSeries, degree: int, ridge_alpha: float = 0.0) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Coefficients and year scaling of `fit_polynomials`."""
+    fit = fit_polynomials(series, degree, ridge_alpha)
+    return fit.coefficients, fit.center, fit.spread
+
+def evaluate_polynomial(coefficients: np.ndarray, center: np.ndarray, spread: np.ndarray, years: np.ndarray) -> np.ndarray:
+    x = (years - center[:, None]) / spread[:, None]
+    return np.einsum("cnk,ck->cn", _vandermonde(x, coefficients.shape[1] - 1), coefficients)
+
+@lru_cache(maxsize=None)
+def _t_quantile(level: float, dof: int) -> float:
+    return float(stats.t.ppf(0.5 + level / 2, dof)) if dof > 0 else np.nan
+
+def prediction_intervals(fit: PolynomialFit, years: np.ndarray, level: float = INTERVAL_LEVEL) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Predictions at `years` (countries x points) and the bounds of their `level` prediction intervals.
+
+    Var(y₀ - ŷ₀) = σ²(1 + x₀ᵀ(XᵀX)⁻¹x₀), scaled by Student's t on the fit's
+    residual degrees of freedom. Bounds are NaN for fits without any.
+    """
+    x = (years - fit.center[:, None]) / fit.spread[:, None]
+    basis = _vandermonde(x, fit.coefficients.shape[1] - 1)
+    predictions = np.einsum("cnk,ck->cn", basis, fit.coefficients)
+    leverage = ((basis @ fit.covariance) * basis).sum(axis=2)
+    quantile = np.array([_t_quantile(level, int(dof)) for dof in fit.dof])
+    with np.errstate(invalid="ignore"):
+        half_width = quantile[:, None] * np.sqrt(fit.residual_variance[:, None] * (1 + leverage))
+    return predictions, predictions - half_width, predictions + half_width
+
+def future_years_for(series: GroupedSeries, years_to_predict: int) -> np.ndarray:
+    last_year = np.where(series.mask, series.years, -np.inf).max(axis=1)
+    return last_year[:, None] + 1 + np.arange(years_to_predict)
+
+def batch_forecast(series: GroupedSeries, years_to_predict: int, degree: int) -> BatchForecast:
+    """Fit a polynomial of `degree` per country and extrapolate `years_to_predict` years past its last point.
+
+    The INTERVAL_LEVEL prediction intervals come from the same fit.
+    """
+    fit = fit_polynomials(series, degree)
+    future_years = future_years_for(series, years_to_predict)
+    predictions, lower, upper = prediction_intervals(fit, future_years)
+    return BatchForecast(series.countries, future_years.astype(int), predictions, fit.coefficients, lower, upper)
+
+def cached_forecasts(dataframe: pd.DataFrame, countries: list, target_column: str, years_to_predict: int, degree: int) -> dict:
+    """Per-country forecasts, fitting only the countries missing from `forecast_cache`.
+
+    Entries are keyed by country, target column, model spec, horizon and the
+    fingerprint of that country's own rows, so reruns that only change how
+    the chart looks, or add and remove other countries, reuse the previous
+    fits. Countries without data map to None.
+    """
+    rows = dc.group_fingerprints(dataframe, countries, ["year", target_column])
+    keys = {country: (country, target_column, ("polynomial", degree), years_to_predict, rows[country]) for country in countries}
+
+    forecasts = {}
+    missing = []
+    for country, key in keys.items():
+        cached = forecast_cache.get(key, _MISSING)
+        if cached is _MISSING:
+            missing.append(country)
+        else:
+            forecasts[country] = cached
+
+    if missing:
+        series = group_series(dataframe, missing, target_column)
+        batch = batch_forecast(series, years_to_predict, degree) if series.countries else None
+        fitted = {}
+        for position, country in enumerate(series.countries):
+            years, values = series.series(position)
+            fitted[country] = CountryForecast(
+                country, years, values, batch.future_years[position], batch.predictions[position],
+                batch.lower[position], batch.upper[position]
+            )
+        for country in missing:
+            forecasts[country] = fitted.get(country)
+            forecast_cache.put(keys[country], forecasts[country])
+
+    return {country: forecasts[country] for country in countries}
+
+def forecast_cache_stats() -> dict:
+    return {
+        "hits": forecast_cache.hits,
+        "misses": forecast_cache.misses,
+        "lookups": forecast_cache.lookups,
+        "evictions": forecast_cache.evictions,
+        "size": len(forecast_cache.data),
+    }
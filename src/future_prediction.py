@@ -1,12 +1,18 @@
 import streamlit as st
-import pandas as pd
+import numpy as np
 import plotly.graph_objects as go
-import src.service as s
-import plotly as p
+import src.forecasting as fc
+import src.model_zoo as mz
+import src.figure_payload as fp
+import src.profiler as prof
 from colormap import Colormap as cm
 
 color_palette = cm.COLORMAP.value
 
+def translucent(hex_color: str, opacity: float = 0.2) -> str:
+    red, green, blue = (int(hex_color[i:i + 2], 16) for i in (1, 3, 5))
+    return f"rgba({red}, {green}, {blue}, {opacity})"
+
 class FuturePrediction:
     def __init__(self, selected_countries, years_to_predict, scale_type, dataframe, target_column):
         self.selected_countries = selected_countries
@@ -15,51 +21,87 @@ class FuturePrediction:
         self.dataframe = dataframe
         self.target_column = target_column
 
-    def predict_with_model(self, model):
-        predictions_fig = go.Figure()
-        country_data = self.dataframe[self.dataframe["country"].isin(self.selected_countries)]
+    @prof.profiled("FuturePrediction.predict_with_model", rows_in=lambda self, *args, **kwargs: len(self.dataframe))
+    def predict_with_model(self, degree, forecasts=None, model_names=None):
+        """Figure of the historical series and forecasts; `forecasts` are fitted here unless given.
 
-        for country in self.selected_countries:
-            country_specific_data = country_data[country_data["country"] == country]
-            country_specific_data = country_specific_data[["year", self.target_column]].dropna()
+        `model_names` (country -> name) labels each prediction with the model
+        that made it. Forecasts that carry prediction intervals get a shaded
+        band, grouped with their prediction in the legend.
+        """
+        predictions_fig = go.Figure()
+        if forecasts is None:
+            forecasts = fc.cached_forecasts(
+                self.dataframe, self.selected_countries, self.target_column, self.years_to_predict, degree
+            )
+        color_map = {country: color_palette[i % len(color_palette)] for i, country in enumerate(self.selected_countries)}
 
-            if country_specific_data.empty:
+        for country, forecast in forecasts.items():
+            if forecast is None:
                 st.warning(f"No valid data for predictions for: {country}")
                 continue
 
-            future_years, predictions = s.predict_future_values_with_models(
-                country_specific_data, self.target_column, self.years_to_predict, model
-            )
-            
-            color_map = {country: color_palette[i % len(color_palette)] for i, country in enumerate(self.selected_countries)}
-
             predictions_fig.add_trace(go.Scatter(
-                x=country_specific_data["year"],
-                y=country_specific_data[self.target_column],
+                x=forecast.years,
+                y=forecast.values,
                 mode="lines",
                 name=f"Historical {self.target_column} ({country})",
                 line=dict(color=color_map[country])  
             ))
+            if forecast.lower is not None and np.isfinite(forecast.lower).all():
+                predictions_fig.add_trace(go.Scatter(
+                    x=np.concatenate([forecast.future_years, forecast.future_years[::-1]]),
+                    y=np.concatenate([forecast.upper, forecast.lower[::-1]]),
+                    fill="toself",
+                    fillcolor=translucent(color_map[country]),
+                    line=dict(width=0),
+                    hoverinfo="skip",
+                    name=f"{fc.INTERVAL_LEVEL:.0%} prediction interval ({country})",
+                    legendgroup=f"predicted {country}",
+                    showlegend=False
+                ))
             predictions_fig.add_trace(go.Scatter(
-                x=future_years.flatten(),
-                y=predictions,
+                x=forecast.future_years,
+                y=forecast.predictions,
                 mode="lines+markers",
-                name=f"Predicted {self.target_column} ({country})",
+                legendgroup=f"predicted {country}",
+                name=f"Predicted {self.target_column} ({country}, {model_names[country]})" if model_names
+                else f"Predicted {self.target_column} ({country})",
                 line=dict(color=color_map[country])  
             ))
 
         return predictions_fig
 
-    def plot(self, tab, model, special_function=None):
+    def plot(self, tab, degree, special_function=None, forecasts=None):
         with tab:
             special_function
-            log_scale = self.scale_type
-            fig_pred = self.predict_with_model(model)
-            fig_pred.update_layout(
-                title=f"Prediction for Next {self.years_to_predict} Years",
-                xaxis_title="Year",
-                yaxis_title=self.target_column,  
-                legend_title="Country",
-                yaxis_type='log' if log_scale else 'linear'
+            fig_pred = self.predict_with_model(degree, forecasts)
+            self._style(fig_pred)
+            fp.plotly_chart(fig_pred, use_container_width=True)
+
+    def plot_model_selection(self, tab, selection):
+        """Forecast each country with its best backtested model, above the backtest errors of every candidate."""
+        with tab:
+            model_names = {country: model.name for country, model in selection.choices.items()}
+            fig_pred = self.predict_with_model(None, selection.forecasts, model_names)
+            self._style(fig_pred)
+            fp.plotly_chart(fig_pred, use_container_width=True)
+
+            st.caption(
+                f"Mean absolute error of each model over up to {mz.BACKTEST_FOLDS} rolling-origin backtests "
+                f"of {self.years_to_predict} years. The lowest error per country (highlighted) is used."
             )
-            st.plotly_chart(fig_pred, use_container_width=True)
+            st.dataframe(
+                selection.errors.style.highlight_min(axis=1).format("{:.3f}", na_rep="–"),
+                use_container_width=True
+            )
+
+    def _style(self, fig_pred):
+        log_scale = self.scale_type
+        fig_pred.update_layout(
+            title=f"Prediction for Next {self.years_to_predict} Years",
+            xaxis_title="Year",
+            yaxis_title=self.target_column,  
+            legend_title="Country",
+            yaxis_type='log' if log_scale else 'linear'
+        )
@@ -1,10 +1,16 @@
 import pandas as pd
 import streamlit as st
 import plotly.graph_objects as go
-import statsmodels.api as sm
 import numpy as np
-import statsmodels.api as sm
+import src.regression as reg
 import src.service as s
+import src.figure_payload as fp
+import src.filter_engine as fe
+import src.raw_data_view as rdv
+import src.lazy_sections as ls
+import src.background_jobs as bj
+import src.dataset_cache as dc
+import src.profiler as prof
 from colormap import Colormap as cm
 
 color_palette = cm.COLORMAP.value
@@ -30,24 +36,43 @@ class HeatmapScatter:
     def filter_data(self) -> pd.DataFrame:
         """Filter the data based on selected country, year range, and continent."""
         df = self.dataframes
+        index = None
 
         if isinstance(df, dict):
             df = pd.concat(df.values(), ignore_index=True)
+        else:
+            index = s.get_dataset_index(df)
+
+        if "continent" not in df.columns:
+            df = s.add_continent_column(df)
+            index = None
+
+        df, _ = fe.apply_filters(df, self.selection_predicates(), index)
+        return df
+
+    def selection_predicates(self) -> list:
+        """Filter predicates for the selected continent, countries and year range."""
+        predicates = []
 
         if self.selected_continent and self.selected_continent != "World":
-            countries_in_continent = s.get_countries_by_continent([df], self.selected_continent)
-            df = df[df["country"].isin(countries_in_continent)]
+            predicates.append(fe.SetPredicate("continent", (self.selected_continent,)))
 
         if self.selected_country:
-            df = df[df["country"].isin(self.selected_country)]
+            predicates.append(fe.SetPredicate("country", tuple(self.selected_country)))
 
         if self.selected_year_range:
-            df = df[(df["year"] >= self.selected_year_range[0]) & (df["year"] <= self.selected_year_range[1])]
+            predicates.append(fe.RangePredicate("year", self.selected_year_range[0], self.selected_year_range[1]))
 
-        return df
+        return predicates
     
     def filter_dataframe_by_continent(self, continent: str):
-        return self.dataframes[self.dataframes["country"].isin(s.get_countries_by_continent([self.dataframes], continent))]
+        return s.filter_by_continent(self.dataframes, continent)
+
+    def selected_countries_in_continent(self) -> list:
+        if not self.selected_continent or self.selected_continent == "World":
+            return list(self.selected_country)
+        continent_countries = set(s.get_dataset_metadata(self.dataframes).countries_in(self.selected_continent))
+        return [country for country in self.selected_country if country in continent_countries]
 
     def display_heatmap(self):
         """Display the heatmap based on the selected data source."""
@@ -56,85 +81,113 @@ class HeatmapScatter:
         
         if data_source == "Selected Continent":
             data_df = None
+            countries = None
+            year_range = None
+            predicates = []
             match self.selected_continent:
                 case "World":
-                    data_df = self.dataframes.copy()
+                    data_df = self.dataframes
                 
-                case "Africa":
-                    data_df = self.filter_dataframe_by_continent("Africa")
-                    
-                case "Asia":
-                    data_df = self.filter_dataframe_by_continent("Asia")
-                
-                case "Europe":
-                    data_df = self.filter_dataframe_by_continent("Europe")
-                    
-                case "North America":
-                    data_df = self.filter_dataframe_by_continent("North America")
-                    
-                case "South America":
-                    data_df = self.filter_dataframe_by_continent("South America")
+                case "Africa" | "Asia" | "Europe" | "North America" | "South America":
+                    data_df = self.filter_dataframe_by_continent(self.selected_continent)
+                    countries = s.get_dataset_metadata(self.dataframes).countries_in(self.selected_continent)
+                    predicates = [fe.SetPredicate("continent", (self.selected_continent,))]
                     
                 case _:
                     data_df = self.filter_data()
-                    self.display_specific_heatmap(data_df)    
+                    countries = self.selected_countries_in_continent() if self.selected_country else None
+                    year_range = self.selected_year_range
+                    predicates = self.selection_predicates()
                 
             if isinstance(data_df, dict):
                 data_df = pd.concat(data_df.values(), ignore_index=True)
-            self.display_specific_heatmap(data_df)
+            self.display_specific_heatmap(data_df, countries, year_range, predicates)
             
         elif data_source == "Selected Countries":
             if not self.selected_country:
                 st.warning("Please select at least one country to use this feature.")
             else:
-                self.display_specific_heatmap(self.filtered_df)
+                self.display_specific_heatmap(
+                    self.filtered_df, self.selected_countries_in_continent(), self.selected_year_range, self.selection_predicates()
+                )
 
-    def display_specific_heatmap(self, data):
-        """Render the heatmap and raw data views."""
+    def correlation_matrix(self, data, countries=None, year_range=None) -> pd.DataFrame:
+        """Correlations for a selection, assembled from the dataset's precomputed blocks when possible."""
+        if isinstance(self.dataframes, pd.DataFrame):
+            return s.get_correlation_engine(self.dataframes).correlation(countries, year_range)
+        return data.select_dtypes(include="number").corr()
+
+    @prof.profiled("HeatmapScatter.display_specific_heatmap")
+    def display_specific_heatmap(self, data, countries=None, year_range=None, predicates=None):
+        """Render the heatmap or the raw data view, whichever tab is shown."""
         if data is not None:
-            tab1, tab2 = st.tabs(["Correlation Heatmap", "Raw Data"])
+            tab = ls.section_tabs(["Correlation Heatmap", "Raw Data"], key="heatmap_tab")
 
             numerical_cols = data.select_dtypes(include="number")
             
             if numerical_cols.shape[1] > 1:
-                correlation_matrix = numerical_cols.corr()
-
-                tab2.dataframe(data)
-
-                with tab1:
-                    fig = go.Figure(data=go.Heatmap(
-                        z=correlation_matrix.values,
-                        x=correlation_matrix.columns,
-                        y=correlation_matrix.columns,
-                        colorscale="RdBu",
-                        zmin=-1,
-                        zmax=1,
-                        colorbar=dict(title="Correlation"),
-                        hoverongaps=False
-                    ))
-
-                    fig.update_layout(
-                        title="Correlation Heatmap",
-                        xaxis_title="Columns",
-                        yaxis_title="Columns",
-                        autosize=True,
-                        height=700,
-                        width=900
+                if tab == "Raw Data":
+                    if isinstance(self.dataframes, pd.DataFrame):
+                        rdv.render_raw_data(st.container(), self.dataframes, predicates, s.get_dataset_index(self.dataframes))
+                    else:
+                        rdv.render_raw_data(st.container(), data)
+                else:
+                    inputs = (
+                        dc.selection_fingerprint(data),
+                        tuple(countries) if countries is not None else None,
+                        tuple(year_range) if year_range is not None else None,
                     )
-
-                    st.plotly_chart(fig, use_container_width=True)
+                    if isinstance(self.dataframes, pd.DataFrame):
+                        ls.deferred_section(
+                            "heatmap_matrix",
+                            inputs,
+                            lambda matrix: fp.plotly_chart(self.heatmap_figure(matrix), key="heatmap_fig", use_container_width=True),
+                            bj.correlation_matrix,
+                            self.dataframes, countries, year_range
+                        )
+                    else:
+                        ls.plotly_section(
+                            "heatmap_fig",
+                            inputs,
+                            lambda: self.heatmap_figure(self.correlation_matrix(data, countries, year_range)),
+                            use_container_width=True
+                        )
             else:
                 st.warning("Not enough numerical columns in the dataset to create a heatmap.")
 
+    @staticmethod
+    def heatmap_figure(correlation_matrix: pd.DataFrame) -> go.Figure:
+        fig = go.Figure(data=go.Heatmap(
+            z=correlation_matrix.values,
+            x=correlation_matrix.columns,
+            y=correlation_matrix.columns,
+            colorscale="RdBu",
+            zmin=-1,
+            zmax=1,
+            colorbar=dict(title="Correlation"),
+            hoverongaps=False
+        ))
+
+        fig.update_layout(
+            title="Correlation Heatmap",
+            xaxis_title="Columns",
+            yaxis_title="Columns",
+            autosize=True,
+            height=700,
+            width=900
+        )
+        return fig
+
+    @prof.profiled("HeatmapScatter.display_scatterplot", rows_in=lambda self: len(self.filtered_df))
     def display_scatterplot(self):
         if len(self.selected_country) != 0:
             if self.filtered_df is not None:
                 st.subheader("Scatter plot")
 
-                self.filtered_df = self.filtered_df.dropna()
+                scatter_df = self.filtered_df.dropna(subset=self.filtered_df.columns.drop("continent", errors="ignore"))
                 col1, col2 = st.columns([1, 1])
-                x_variable = col1.selectbox("Select X-axis", self.filtered_df.select_dtypes(include='number').columns, index=0, key="scatter_x")
-                y_variable = col2.selectbox("Select Y-axis", self.filtered_df.select_dtypes(include='number').columns, index=1, key="scatter_y")
+                x_variable = col1.selectbox("Select X-axis", scatter_df.select_dtypes(include='number').columns, index=0, key="scatter_x")
+                y_variable = col2.selectbox("Select Y-axis", scatter_df.select_dtypes(include='number').columns, index=1, key="scatter_y")
 
                 show_country_trendline = st.checkbox("Show Country Trendlines", value=False, key="country_trendline")
                 show_general_trendline = st.checkbox("Show General Trendline", value=False, key="general_trendline")
@@ -143,52 +196,46 @@ class HeatmapScatter:
 
                 color_map = {country: color_palette[i % len(color_palette)] for i, country in enumerate(self.selected_country)}
 
-                all_x = []
-                all_y = []
-                
-                for country in self.selected_country:
-                    country_data = self.filtered_df[self.filtered_df["country"] == country]
+                country_rows = scatter_df.groupby("country", observed=True, sort=False).indices
+                plotted_countries = [country for country in self.selected_country if country in country_rows]
+                rows = np.concatenate([country_rows[country] for country in plotted_countries] or [np.empty(0, dtype=int)])
+                codes = np.repeat(np.arange(len(plotted_countries)), [len(country_rows[country]) for country in plotted_countries])
+                x_values = scatter_df[x_variable].to_numpy()[rows]
+                y_values = scatter_df[y_variable].to_numpy()[rows]
+
+                trendlines = None
+                if show_country_trendline or show_general_trendline:
+                    trendlines = reg.grouped_linear_fit(codes, x_values, y_values, len(plotted_countries))
 
-                    if country_data.empty:
+                for country in self.selected_country:
+                    if country not in country_rows:
                         st.warning(f"No data available for **{country}** to create scatterplot.")
                         continue
 
-                    all_x.extend(country_data[x_variable].values)
-                    all_y.extend(country_data[y_variable].values)
+                    position = plotted_countries.index(country)
+                    in_country = codes == position
 
                     fig.add_trace(go.Scatter(
-                        x=country_data[x_variable],  
-                        y=country_data[y_variable],  
+                        x=x_values[in_country],  
+                        y=y_values[in_country],  
                         mode="markers",  
                         name=f"{country} {x_variable} vs {y_variable}",
                         marker=dict(size=8, color=color_map[country])  
                     ))
 
                     if show_country_trendline:
-                        x = country_data[x_variable].values
-                        y = country_data[y_variable].values
-                        x_with_const = sm.add_constant(x)
-                        model = sm.OLS(y, x_with_const).fit()
-                        trendline = model.predict(x_with_const)
-
                         fig.add_trace(go.Scatter(
-                            x=x,
-                            y=trendline,
+                            x=trendlines["x_range"][position],
+                            y=trendlines["y_range"][position],
                             mode="lines",
                             name=f"{country} Trendline",
                             line=dict(color=color_map[country], dash="dash")
                         ))
 
                 if show_general_trendline:
-                    all_x = np.array(all_x)
-                    all_y = np.array(all_y)
-                    all_x_with_const = sm.add_constant(all_x)
-                    general_model = sm.OLS(all_y, all_x_with_const).fit()
-                    general_trendline = general_model.predict(all_x_with_const)
-
                     fig.add_trace(go.Scatter(
-                        x=all_x,
-                        y=general_trendline,
+                        x=trendlines["pooled"]["x_range"],
+                        y=trendlines["pooled"]["y_range"],
                         mode="lines",
                         name="General Trendline",
                         line=dict(color="white", dash="dash")
@@ -202,6 +249,6 @@ class HeatmapScatter:
                     legend_title="Country",
                     showlegend=True
                 )
-                st.plotly_chart(fig, use_container_width=True)
+                fp.plotly_chart(fig, use_container_width=True)
             else:
                 st.warning("No data available for the selected criteria to create a scatterplot.")
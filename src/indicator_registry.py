@@ -0,0 +1,124 @@
+"""Registry of the indicator files that make up the merged dataset.
+
+Indicators are declared in `data/indicators.json`. Each entry names the
+metric column, the CSV it comes from and, optionally, the sidebar filter
+built for it:
+
+    {"name": "GDP_per_capita", "path": "data/gdp-per-capita-worldbank.csv",
+     "filter": {"checkbox": "Apply GDP per Capita Filter", "slider": "GDP per Capita in USD", "position": 2}}
+
+`column` (default: `name`), `dtype` (default: float32) and the key columns
+can be overridden per entry. A filter without a checkbox is always applied.
+"""
+import json
+from dataclasses import dataclass, field, replace
+import numpy as np
+import pandas as pd
+
+REGISTRY_PATH = "data/indicators.json"
+CHUNK_ROWS = 200_000
+
+@dataclass(frozen=True)
+class AttributeFilter:
+    slider: str
+    checkbox: str = None
+    max: float = None
+    position: int = 0
+
+@dataclass(frozen=True)
+class Indicator:
+    name: str
+    path: str
+    column: str = None
+    dtype: str = "float32"
+    country_column: str = "country"
+    code_column: str = "Code"
+    year_column: str = "year"
+    filter: AttributeFilter = field(default=None, compare=False)
+
+    @property
+    def value_column(self) -> str:
+        return self.column or self.name
+
+def load_registry(path: str = REGISTRY_PATH) -> list[Indicator]:
+    with open(path, encoding="utf-8") as file:
+        entries = json.load(file)["indicators"]
+    return [
+        Indicator(**{**entry, "filter": AttributeFilter(**entry["filter"]) if entry.get("filter") else None})
+        for entry in entries
+    ]
+
+def file_mapping(indicators: list[Indicator]) -> dict:
+    """Indicator name -> source path, the form the dataset cache fingerprints."""
+    return {indicator.name: indicator.path for indicator in indicators}
+
+def resolve(file_mapping: dict, indicators: list[Indicator]) -> list[Indicator]:
+    """Indicators for a file mapping; names missing from the registry get the defaults."""
+    known = {indicator.name: indicator for indicator in indicators}
+    return [
+        replace(known[name], path=path) if name in known else Indicator(name, path)
+        for name, path in file_mapping.items()
+    ]
+
+def _line_count(path: str) -> int:
+    """Lines in `path`, counting a last line without a newline; an upper bound on its records."""
+    count, last = 0, b"\n"
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            count += block.count(b"\n")
+            last = block[-1:]
+    return count + (last != b"\n")
+
+def _fill_codes(target: np.ndarray, start: int, values: pd.Series, index: dict):
+    """Write the codes of categorical `values` into `target`, in the running category order of `index`."""
+    mapping = np.array([index.setdefault(category, len(index)) for category in values.cat.categories] + [-1], dtype=target.dtype)
+    target[start:start + len(values)] = mapping[values.cat.codes.to_numpy()]
+
+def read_indicator(indicator: Indicator, chunksize: int = CHUNK_ROWS) -> pd.DataFrame:
+    """Stream one indicator CSV into a compact long frame (country, Code, year, value).
+
+    Only the declared columns are parsed, with their dtypes fixed up front.
+    The output columns are allocated once from the file's line count and
+    each chunk is written into them before the next one is read, so the
+    peak stays near the size of the result plus one chunk.
+    """
+    columns = {
+        indicator.country_column: "category",
+        indicator.year_column: np.int64,
+        indicator.value_column: indicator.dtype,
+    }
+    with open(indicator.path, encoding="utf-8") as file:
+        header = file.readline().rstrip("\r\n").split(",")
+    has_code = indicator.code_column in header
+    if has_code:
+        columns[indicator.code_column] = "category"
+
+    capacity = max(_line_count(indicator.path) - 1, 0)
+    country_codes = np.empty(capacity, dtype=np.int32)
+    code_codes = np.empty(capacity if has_code else 0, dtype=np.int32)
+    years = np.empty(capacity, dtype=np.int16)
+    values = np.empty(capacity, dtype=indicator.dtype)
+    countries, codes = {}, {}
+
+    rows = 0
+    for chunk in pd.read_csv(indicator.path, usecols=list(columns), dtype=columns, chunksize=chunksize):
+        end = rows + len(chunk)
+        _fill_codes(country_codes, rows, chunk[indicator.country_column], countries)
+        if has_code:
+            _fill_codes(code_codes, rows, chunk[indicator.code_column], codes)
+        years[rows:end] = chunk[indicator.year_column].to_numpy()
+        values[rows:end] = chunk[indicator.value_column].to_numpy()
+        rows = end
+        del chunk
+
+    data = {"country": pd.Categorical.from_codes(country_codes[:rows], categories=list(countries))}
+    if has_code:
+        data["Code"] = pd.Categorical.from_codes(code_codes[:rows], categories=list(codes))
+    data["year"] = years[:rows]
+    data[indicator.name] = values[:rows]
+    return pd.DataFrame(data, copy=False)
+
+def attribute_filters(indicators: list[Indicator], columns) -> list[Indicator]:
+    """Indicators with a sidebar filter whose column is in the dataset, in display order."""
+    with_filters = [indicator for indicator in indicators if indicator.filter and indicator.name in columns]
+    return sorted(with_filters, key=lambda indicator: indicator.filter.position)
@@ -0,0 +1,157 @@
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+import streamlit as st
+import src.figure_payload as fp
+import src.profiler as prof
+import src.service as s
+
+logger = logging.getLogger(__name__)
+
+SECTION_STATE_KEY = "_lazy_sections"
+JOB_STATE_KEY = "_background_jobs"
+POLL_SECONDS = 0.1
+
+_local = threading.local()
+
+@dataclass
+class _Job:
+    inputs: object
+    future: object
+    function: object
+    args: tuple
+
+@dataclass
+class _DeferredRun:
+    requested: set = field(default_factory=set)
+    pending: list = field(default_factory=list)
+
+def section_tabs(labels: list, key: str) -> str:
+    """Tab bar that only reports the visible tab, so hidden tabs are never built.
+
+    `st.tabs` runs the body of every tab on each rerun; this renders the tab
+    labels as a horizontal radio and returns the selected one instead.
+    """
+    return st.radio(key, labels, horizontal=True, key=key, label_visibility="collapsed")
+
+def cached(key: str, inputs, builder):
+    """Result of `builder()`, reused across reruns while `inputs` stays the same.
+
+    One result is kept per section key in the session, so the store never
+    grows beyond the number of sections. `inputs` must be comparable with ==,
+    e.g. a tuple of a selection fingerprint and the widget values the builder
+    reads. Builders returning None are rebuilt on every run.
+    """
+    sections = st.session_state.setdefault(SECTION_STATE_KEY, {})
+    entry = sections.get(key)
+    if entry is not None and entry[0] == inputs:
+        return entry[1]
+    result = builder()
+    if result is not None:
+        sections[key] = (inputs, result)
+    return result
+
+def plotly_section(key: str, inputs, builder, budget: int = fp.PAYLOAD_BUDGET_BYTES, **kwargs):
+    """Build, compact and render a figure, skipping all three steps when `inputs` are unchanged."""
+    figure = cached(key, (inputs, budget), lambda: _prepared(builder(), budget, key))
+    if figure is not None:
+        st.plotly_chart(figure, key=key, **kwargs)
+    return figure
+
+def _prepared(figure, budget: int, name: str):
+    return fp.prepare_figure(figure, budget, name) if figure is not None else None
+
+def start_deferred_run():
+    """Forget the placeholders of the previous script run. Call once at the top of the script."""
+    _local.run = _DeferredRun()
+
+def _deferred_run() -> _DeferredRun:
+    if getattr(_local, "run", None) is None:
+        start_deferred_run()
+    return _local.run
+
+def deferred_section(key: str, inputs, render, function, *args, local: bool = False):
+    """Compute `function(*args)` in the background pool and `render` its result where this is called.
+
+    A result cached for the same `inputs` is rendered right away. Otherwise
+    the job is submitted (or the one already in flight for these inputs is
+    reused, e.g. after a rerun interrupted the wait), an empty placeholder
+    takes its place in the layout and `fill_deferred_sections` renders into
+    it when the job finishes. A job still running for other inputs of the
+    same section is stale and gets cancelled. With `render=None` the result
+    is only prefetched into the cache. `local` runs the function on a thread
+    of this process instead, for coordinators that submit jobs themselves.
+    """
+    sections = st.session_state.setdefault(SECTION_STATE_KEY, {})
+    jobs = st.session_state.setdefault(JOB_STATE_KEY, {})
+    run = _deferred_run()
+    run.requested.add(key)
+
+    entry = sections.get(key)
+    if entry is not None and entry[0] == inputs:
+        jobs.pop(key, None)
+        if render is not None:
+            render(entry[1])
+        return
+
+    job = jobs.get(key)
+    if job is None or job.inputs != inputs:
+        if job is not None:
+            job.future.cancel()
+        runner = s.get_job_runner()
+        future = (runner.submit_local if local else runner.submit)(function, *args)
+        job = jobs[key] = _Job(inputs, future, function, args)
+
+    if job.future.done():
+        with prof.stage(f"deferred:{key}"):
+            result = _collect(key, job)
+            if render is not None:
+                render(result)
+    elif render is not None:
+        placeholder = st.empty()
+        placeholder.caption("Computing…")
+        run.pending.append((key, job, placeholder, render, time.perf_counter()))
+
+def _collect(key: str, job: _Job):
+    """The job's result, stored in the section cache. Failed jobs are rebuilt in the script thread."""
+    try:
+        result = job.future.result()
+    except Exception as error:
+        logger.warning("Background job %r failed (%s); building it in the script thread", key, error)
+        result = job.function(*job.args)
+    jobs = st.session_state.get(JOB_STATE_KEY, {})
+    if jobs.get(key) is job:
+        del jobs[key]
+    if result is not None:
+        st.session_state.setdefault(SECTION_STATE_KEY, {})[key] = (job.inputs, result)
+    return result
+
+def fill_deferred_sections():
+    """Render the deferred sections of this run as their jobs finish. Call once at the end of the script.
+
+    Jobs of sections this run did not ask for (a closed tab, an unticked
+    option) are cancelled first. While waiting, the loop touches
+    `st.session_state`, which is where Streamlit interrupts a script whose
+    widgets changed, so a rerun starts right away and reuses the jobs that
+    are still current.
+    """
+    run = _deferred_run()
+    jobs = st.session_state.setdefault(JOB_STATE_KEY, {})
+    for key in [key for key in jobs if key not in run.requested]:
+        jobs.pop(key).future.cancel()
+
+    pending = {entry[1].future: entry for entry in run.pending}
+    while pending:
+        done, _ = wait(pending, timeout=POLL_SECONDS, return_when=FIRST_COMPLETED)
+        st.session_state.get(JOB_STATE_KEY)
+        for future in done:
+            key, job, placeholder, render, deferred_at = pending.pop(future)
+            with prof.stage(f"deferred:{key}") as record:
+                result = _collect(key, job)
+                with placeholder.container():
+                    render(result)
+                if record is not None:
+                    record.wait_ms = (time.perf_counter() - deferred_at) * 1000
+    _local.run = None
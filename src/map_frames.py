@@ -0,0 +1,148 @@
+import copy
+import math
+import os
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from repoze.lru import LRUCache
+import src.dataset_cache as dc
+
+# Unset (or 0) animates every year; a positive value opts in to striding long ranges.
+DEFAULT_MAX_FRAMES = int(os.environ.get("CO2_MAP_MAX_FRAMES", 0)) or None
+
+continent_scope = {
+    "World": "world",
+    "Europe": "europe",
+    "Asia": "asia",
+    "North America": "north america",
+    "South America": "south america",
+    "Africa": "africa"
+}
+
+_frame_cache = LRUCache(16)
+
+def pivot_country_year(dataframe: pd.DataFrame, target_column: str) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Pivot the long frame into a dense country x year float32 matrix (NaN where missing)."""
+    data = dataframe[["country", "year", target_column]].dropna()
+    country_codes, countries = pd.factorize(data["country"], sort=True)
+    year_codes, years = pd.factorize(data["year"], sort=True)
+
+    matrix = np.full((len(countries), len(years)), np.nan, dtype=np.float32)
+    matrix[country_codes, year_codes] = data[target_column].to_numpy(dtype=np.float32)
+    return np.asarray(countries, dtype=object), np.asarray(years), matrix
+
+def stride_years(years: np.ndarray, max_frames: int = None) -> np.ndarray:
+    """Column positions to animate, keeping at most `max_frames` and always the last year."""
+    positions = np.arange(len(years))
+    if not max_frames or len(years) <= max_frames:
+        return positions
+    stride = math.ceil(len(years) / max_frames)
+    return np.unique(np.append(positions[::stride], positions[-1]))
+
+def _animation_args(duration: int) -> dict:
+    return {
+        "frame": {"duration": duration, "redraw": True},
+        "mode": "immediate",
+        "fromcurrent": True,
+        "transition": {"duration": duration, "easing": "linear"},
+    }
+
+@lru_cache(maxsize=None)
+def _base_layout(scope: str) -> dict:
+    figure = go.Figure(layout=dict(
+        geo=dict(
+            scope=scope,
+            showcoastlines=True,
+            coastlinecolor="Black",
+            projection_type="natural earth",
+            domain=dict(x=[0.0, 1.0], y=[0.0, 1.0]),
+        ),
+        coloraxis=dict(colorscale="Viridis", cmin=0),
+        legend=dict(tracegroupgap=0),
+        margin=dict(t=60),
+        updatemenus=[dict(
+            buttons=[
+                dict(args=[None, _animation_args(500)], label="&#9654;", method="animate"),
+                dict(args=[[None], _animation_args(0)], label="&#9724;", method="animate"),
+            ],
+            direction="left", pad=dict(r=10, t=70), showactive=False, type="buttons",
+            x=0.1, xanchor="right", y=0, yanchor="top",
+        )],
+    ))
+    return figure.to_plotly_json()["layout"]
+
+def base_map_figure(scope: str) -> go.Figure:
+    """A fresh figure carrying the cached geo layout and animation controls for `scope`."""
+    return go.Figure(layout=copy.deepcopy(_base_layout(scope)))
+
+def build_frames(dataframe: pd.DataFrame, target_column: str, color_label: str, max_frames: int = DEFAULT_MAX_FRAMES) -> list:
+    """Per-year choropleth frames, reused while the filtered rows stay the same."""
+    key = (dc.selection_fingerprint(dataframe), target_column, color_label, max_frames)
+    frames = _frame_cache.get(key)
+    if frames is not None:
+        return frames
+
+    countries, years, matrix = pivot_country_year(dataframe, target_column)
+    frames = []
+    for position in stride_years(years, max_frames):
+        column = matrix[:, position]
+        present = ~np.isnan(column)
+        year = str(years[position])
+        frames.append(dict(
+            name=year,
+            data=[dict(
+                type="choropleth",
+                locations=countries[present],
+                locationmode="country names",
+                z=column[present],
+                coloraxis="coloraxis",
+                geo="geo",
+                name="",
+                hovertemplate=f"<b>%{{location}}</b><br><br>year={year}<br>{color_label}=%{{z}}<extra></extra>",
+            )],
+        ))
+
+    _frame_cache.put(key, frames)
+    return frames
+
+def choropleth_over_time(dataframe: pd.DataFrame, target_column: str, selected_continent: str, title_text: str,
+                         color_max: float, color_label: str, max_frames: int = DEFAULT_MAX_FRAMES) -> go.Figure:
+    """Animated choropleth built from pre-baked per-year frames on a cached base figure."""
+    frames = build_frames(dataframe, target_column, color_label, max_frames)
+    figure = base_map_figure(continent_scope[selected_continent])
+
+    figure.update_layout(
+        title=dict(text=title_text),
+        coloraxis=dict(cmax=color_max, colorbar=dict(title=dict(text=color_label))),
+        sliders=[dict(
+            active=0,
+            currentvalue=dict(prefix="year="),
+            len=0.9, pad=dict(b=10, t=60), x=0.1, xanchor="left", y=0, yanchor="top",
+            steps=[
+                dict(args=[[frame["name"]], _animation_args(0)], label=frame["name"], method="animate")
+                for frame in frames
+            ],
+        )],
+    )
+    first_trace = {key: value for key, value in frames[0]["data"][0].items() if key != "type"} if frames else {}
+    figure.add_trace(go.Choropleth(first_trace, locationmode="country names", coloraxis="coloraxis"))
+    figure.frames = frames
+    return figure
+
+def selection_map(dataframe: pd.DataFrame, target_column: str, selected_continent: str, title_text: str,
+                  color_max: float, color_label: str, marked_locations, max_frames: int = DEFAULT_MAX_FRAMES) -> go.Figure:
+    """The dashboard map: the animated choropleth with the selected countries marked in red."""
+    map_fig = choropleth_over_time(
+        dataframe, target_column, selected_continent, title_text, color_max, color_label, max_frames
+    )
+    map_fig.add_trace(go.Scattergeo(
+        locations=marked_locations,
+        locationmode="country names",
+        mode="markers",
+        marker=dict(size=4, color="red", line=dict(width=4, color="red")),
+        showlegend=False,
+        hoverinfo="location",
+    ))
+    map_fig.update_layout(autosize=True, height=600, title=dict(font=dict(size=24)))
+    return map_fig
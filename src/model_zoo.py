@@ -0,0 +1,225 @@
+"""Candidate forecasting models, rolling-origin backtests and per-country model selection.
+
+Each candidate is backtested per country on rolling origins. It is fitted
+on the points before an origin and scored on the next `horizon` points, for
+up to BACKTEST_FOLDS origins stepping back `horizon` points at a time. The
+candidate with the lowest mean absolute error then forecasts that country.
+Backtest errors are cached per (country, model, horizon, the country's
+rows), so reruns only refit the chosen models.
+"""
+import warnings
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+from repoze.lru import LRUCache
+from statsmodels.tsa.arima.model import ARIMA
+from statsmodels.tsa.holtwinters import ExponentialSmoothing
+import src.dataset_cache as dc
+import src.forecasting as fc
+
+BACKTEST_FOLDS = 3
+MIN_TRAIN_POINTS = 10
+
+backtest_cache = LRUCache(4096)
+_MISSING = object()
+
+@dataclass(frozen=True)
+class PolynomialModel:
+    """Least-squares polynomial trend in the year, optionally ridge-penalized."""
+    degree: int
+    ridge_alpha: float = 0.0
+
+    @property
+    def name(self) -> str:
+        if self.ridge_alpha > 0:
+            return f"Ridge polynomial (degree {self.degree}, α={self.ridge_alpha:g})"
+        return "Linear trend" if self.degree == 1 else f"Polynomial (degree {self.degree})"
+
+@dataclass(frozen=True)
+class ExponentialSmoothingModel:
+    """Holt's linear trend exponential smoothing."""
+    damped: bool = True
+
+    @property
+    def name(self) -> str:
+        return "Damped Holt smoothing" if self.damped else "Holt smoothing"
+
+@dataclass(frozen=True)
+class ArimaModel:
+    """ARIMA on the yearly series, with drift when differenced once."""
+    order: tuple = (1, 1, 1)
+
+    @property
+    def name(self) -> str:
+        return "ARIMA(%d,%d,%d)" % self.order
+
+DEFAULT_MODEL = PolynomialModel(1)
+CANDIDATES = (
+    PolynomialModel(1),
+    PolynomialModel(2),
+    PolynomialModel(3),
+    PolynomialModel(4),
+    PolynomialModel(3, ridge_alpha=1.0),
+    ExponentialSmoothingModel(),
+    ArimaModel((1, 1, 1)),
+)
+
+@dataclass
+class ModelSelection:
+    """Backtest errors (country x model name), the model chosen per country and its forecasts."""
+    errors: pd.DataFrame
+    choices: dict
+    forecasts: dict
+
+def _yearly(years: np.ndarray, values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """The series on a gap-free yearly grid, missing years linearly interpolated."""
+    grid = np.arange(int(years[0]), int(years[-1]) + 1)
+    return grid, np.interp(grid, years, values)
+
+def forecast_series(model, years: np.ndarray, values: np.ndarray, future_years: np.ndarray) -> np.ndarray:
+    """Fit `model` on one country's points and predict at `future_years`, all after its last point."""
+    future_years = np.asarray(future_years, dtype=np.float64)
+    if isinstance(model, PolynomialModel):
+        series = fc.GroupedSeries([None], years[None, :], values[None, :], np.ones((1, len(years)), dtype=bool))
+        coefficients, center, spread = fc.batch_polynomial_fit(series, model.degree, model.ridge_alpha)
+        return fc.evaluate_polynomial(coefficients, center, spread, future_years[None, :])[0]
+
+    grid, filled = _yearly(years, values)
+    with warnings.catch_warnings():
+        # Short or flat series trigger convergence warnings; their backtest error tells the story.
+        warnings.simplefilter("ignore")
+        if isinstance(model, ExponentialSmoothingModel):
+            fitted = ExponentialSmoothing(
+                filled, trend="add", damped_trend=model.damped, initialization_method="estimated"
+            ).fit()
+        elif isinstance(model, ArimaModel):
+            fitted = ARIMA(filled, order=model.order, trend={0: "c", 1: "t"}.get(model.order[1], "n")).fit()
+        else:
+            raise TypeError(f"Unsupported model: {model!r}")
+        path = np.asarray(fitted.forecast(int(future_years.max() - grid[-1])))
+    return path[future_years.astype(int) - int(grid[-1]) - 1]
+
+def _polynomial_backtest(series: fc.GroupedSeries, horizon: int, model: PolynomialModel) -> dict:
+    """Rolling-origin backtest of every country at once, one batched fit per fold."""
+    counts = series.mask.sum(axis=1)
+    slots = np.arange(series.mask.shape[1])
+    absolute = np.zeros(len(series.countries))
+    points = np.zeros(len(series.countries))
+    for fold in range(BACKTEST_FOLDS):
+        origins = counts - horizon * (fold + 1)
+        rows = np.flatnonzero(origins >= MIN_TRAIN_POINTS)
+        if not len(rows):
+            break
+        origin = origins[rows, None]
+        train = series.mask[rows] & (slots < origin)
+        test = series.mask[rows] & (slots >= origin) & (slots < origin + horizon)
+        fold_series = fc.GroupedSeries([series.countries[row] for row in rows], series.years[rows], series.values[rows], train)
+        coefficients, center, spread = fc.batch_polynomial_fit(fold_series, model.degree, model.ridge_alpha)
+        predictions = fc.evaluate_polynomial(coefficients, center, spread, series.years[rows])
+        absolute[rows] += np.where(test, np.abs(predictions - series.values[rows]), 0).sum(axis=1)
+        points[rows] += test.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return dict(zip(series.countries, np.where(points > 0, absolute / points, np.nan)))
+
+def backtest(dataframe: pd.DataFrame, countries: list, target_column: str, horizon: int, model) -> dict:
+    """Mean absolute error of `model` per country over its rolling-origin folds (NaN when too short)."""
+    series = fc.group_series(dataframe, countries, target_column)
+    if isinstance(model, PolynomialModel):
+        errors = _polynomial_backtest(series, horizon, model)
+    else:
+        errors = {}
+        for position, country in enumerate(series.countries):
+            years, values = series.series(position)
+            residuals = [
+                forecast_series(model, years[:origin], values[:origin], years[origin:origin + horizon])
+                - values[origin:origin + horizon]
+                for origin in range(len(years) - horizon, len(years) - horizon * (BACKTEST_FOLDS + 1), -horizon)
+                if origin >= MIN_TRAIN_POINTS
+            ]
+            errors[country] = float(np.mean(np.abs(np.concatenate(residuals)))) if residuals else np.nan
+    return {country: float(errors.get(country, np.nan)) for country in countries}
+
+def forecast(dataframe: pd.DataFrame, countries: list, target_column: str, years_to_predict: int, model) -> dict:
+    """Per-country forecasts of `model`, `years_to_predict` years past each country's last point.
+
+    Polynomial models come with prediction intervals from their batched fit.
+    """
+    series = fc.group_series(dataframe, countries, target_column)
+    if not series.countries:
+        return {country: None for country in countries}
+    future_years = fc.future_years_for(series, years_to_predict)
+    lower = upper = [None] * len(series.countries)
+    if isinstance(model, PolynomialModel):
+        fit = fc.fit_polynomials(series, model.degree, model.ridge_alpha)
+        predictions, lower, upper = fc.prediction_intervals(fit, future_years)
+    else:
+        predictions = [
+            forecast_series(model, *series.series(position), future_years[position])
+            for position in range(len(series.countries))
+        ]
+
+    forecasts = {}
+    for position, country in enumerate(series.countries):
+        years, values = series.series(position)
+        forecasts[country] = fc.CountryForecast(
+            country, years, values, future_years[position].astype(int), np.asarray(predictions[position]),
+            lower[position], upper[position]
+        )
+    return {country: forecasts.get(country) for country in countries}
+
+def _gather(runner, calls: list) -> list:
+    """Results of `function(*args)` for each call, spread over `runner`'s pool when given."""
+    if runner is None:
+        return [function(*args) for function, *args in calls]
+    futures = [runner.submit(*call) for call in calls]
+    return [future.result() for future in futures]
+
+def best_forecasts(dataframe: pd.DataFrame, countries: list, target_column: str, years_to_predict: int,
+                   runner=None, candidates: tuple = CANDIDATES) -> ModelSelection:
+    """Backtest every candidate, pick the lowest-error model per country and forecast with it.
+
+    Candidates run as separate jobs on `runner` (a `JobRunner`), each covering
+    the countries whose backtest is not cached yet. Countries no candidate can
+    be backtested on fall back to DEFAULT_MODEL.
+    """
+    rows = dc.group_fingerprints(dataframe, countries, ["year", target_column])
+    errors = {model: {} for model in candidates}
+    jobs = []
+    for model in candidates:
+        missing = []
+        for country in countries:
+            cached = backtest_cache.get((country, target_column, model, years_to_predict, rows[country]), _MISSING)
+            if cached is _MISSING:
+                missing.append(country)
+            else:
+                errors[model][country] = cached
+        if missing:
+            jobs.append((model, (backtest, dataframe, missing, target_column, years_to_predict, model)))
+
+    for (model, _), result in zip(jobs, _gather(runner, [call for _, call in jobs])):
+        for country, error in result.items():
+            backtest_cache.put((country, target_column, model, years_to_predict, rows[country]), error)
+            errors[model][country] = error
+
+    choices = {}
+    for country in countries:
+        scored = [
+            (errors[model][country], position, model)
+            for position, model in enumerate(candidates) if np.isfinite(errors[model][country])
+        ]
+        choices[country] = min(scored)[2] if scored else DEFAULT_MODEL
+
+    by_model = {}
+    for country, model in choices.items():
+        by_model.setdefault(model, []).append(country)
+    forecasts = {}
+    for result in _gather(runner, [
+        (forecast, dataframe, group, target_column, years_to_predict, model) for model, group in by_model.items()
+    ]):
+        forecasts.update(result)
+
+    table = pd.DataFrame(
+        {model.name: [errors[model][country] for country in countries] for model in candidates},
+        index=pd.Index(countries, name="country"),
+    )
+    return ModelSelection(table, choices, {country: forecasts.get(country) for country in countries})
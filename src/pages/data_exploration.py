@@ -1,33 +1,48 @@
 import streamlit as st
 import plotly.express as px
-import plotly.graph_objects as go
 import numpy as np
 import pandas as pd
+import src.service as s
+import src.figure_payload as fp
+import src.lazy_sections as ls
+import src.background_jobs as bj
+import src.forecasting as fc
+import src.model_zoo as mz
+import src.dataset_cache as dc
+import src.pivots as pv
+import src.profiler as prof
 from src.future_prediction import FuturePrediction
-from sklearn.linear_model import LinearRegression
-from sklearn.preprocessing import PolynomialFeatures
-from sklearn.pipeline import make_pipeline
 from colormap import Colormap as cm
 
 color_palette = cm.COLORMAP.value
 
-def page(filtered_dataframe, merged_dataframe, is_filtered, selected_continent, selected_countries, selected_year_range, target_column):
-    for idx, (dataframe, merged_data) in enumerate(zip(filtered_dataframe, merged_dataframe)):
+BEST_MODEL_TAB = "Best Model (Backtested)"
 
-        map_fig = map_chart(
-            merged_data,
-            dataframe,
-            is_filtered,
-            selected_continent,
-            selected_year_range,
-            selected_countries,
-            target_column
-        )
+def page(filtered_dataframe, merged_dataframe, is_filtered, selected_continent, selected_countries, selected_year_range, target_column,
+         attribute_predicates=()):
+    for idx, (dataframe, merged_data) in enumerate(zip(filtered_dataframe, merged_dataframe)):
+        selection = dc.selection_fingerprint(dataframe)
 
-        if map_fig is None:
+        if dataframe.empty:
+            st.warning("None of the selected countries fit the filters.")
             return
 
-        st.plotly_chart(map_fig, use_container_width=True, key=f"map_fig_{idx}")
+        ls.deferred_section(
+            f"map_fig_{idx}",
+            (selection, is_filtered, selected_continent, tuple(selected_year_range), tuple(selected_countries), target_column),
+            lambda figure, key=f"map_fig_{idx}": st.plotly_chart(figure, key=key, use_container_width=True),
+            bj.map_figure,
+            *map_arguments(
+                merged_data,
+                dataframe,
+                is_filtered,
+                selected_continent,
+                selected_year_range,
+                selected_countries,
+                target_column
+            )
+        )
+
         if len(selected_countries) != 0:
             col_y_axis, col_chart, col_bar = st.columns([1, 5, 3])
 
@@ -62,28 +77,68 @@ def page(filtered_dataframe, merged_dataframe, is_filtered, selected_continent,
                             target_column=target_column
                         )
 
-                        tab1, tab2 = st.tabs(["Linear Regression", "Polynomial Features"])
-
-                        future_prediction.plot(tab1, LinearRegression())
-                        future_prediction.plot(tab2, make_pipeline(PolynomialFeatures(degree=4), LinearRegression()))
+                        models = {"Linear Regression": 1, "Polynomial Features": 4}
+                        model = ls.section_tabs([*models, BEST_MODEL_TAB], key=f"prediction_model_{idx}")
+                        forecast_inputs = (
+                            dc.selection_fingerprint(filtered_dataframe[0]), tuple(selected_countries), target_column, years_to_predict
+                        )
+                        # Both fixed models are fitted in the background; the hidden one is only prefetched.
+                        for name, degree in models.items():
+                            ls.deferred_section(
+                                f"forecast_{idx}_{degree}",
+                                (forecast_inputs, degree),
+                                (lambda forecasts, degree=degree, prediction=future_prediction: prediction.plot(st.container(), degree, forecasts=forecasts))
+                                if name == model else None,
+                                fc.cached_forecasts,
+                                filtered_dataframe[0], selected_countries, target_column, years_to_predict, degree
+                            )
+                        if model == BEST_MODEL_TAB:
+                            ls.deferred_section(
+                                f"model_selection_{idx}",
+                                forecast_inputs,
+                                lambda selection, prediction=future_prediction: prediction.plot_model_selection(st.container(), selection),
+                                mz.best_forecasts,
+                                filtered_dataframe[0], selected_countries, target_column, years_to_predict, s.get_job_runner(),
+                                local=True
+                            )
                     else:
-                        st.plotly_chart(
+                        fp.plotly_chart(
                             chart(dataframe, selected_countries, selected_year_range, target_column, log_scale),
                             use_container_width=True,
                             key=f"chart_{idx}"
                         )
 
             with col_bar:
-                bar_fig = bar_chart(dataframe, selected_year_range, is_filtered, selected_countries, target_column)
-                st.plotly_chart(bar_fig, use_container_width=True, key=f"bar_fig_{idx}")
+                # Rollups of the rows the attribute filters keep; country and year are applied by the store.
+                rollups = s.get_rollups(merged_data, attribute_predicates) if "fingerprint" in merged_data.attrs else None
+                ls.plotly_section(
+                    f"bar_fig_{idx}",
+                    (selection, tuple(selected_year_range), is_filtered, tuple(selected_countries), target_column),
+                    lambda: bar_chart(
+                        dataframe, selected_year_range, is_filtered, selected_countries, target_column, rollups
+                    ),
+                    use_container_width=True
+                )
 
 
+@prof.profiled("chart")
 def chart(dataframe, selected_country, selected_year_range, target_column, log_scale=False):
-    filtered_data = dataframe[(dataframe["country"].isin(selected_country)) 
-                              & (dataframe["year"] >= selected_year_range[0]) 
-                              & (dataframe["year"] <= selected_year_range[1])]
-
-    filtered_data = filtered_data.sort_values(by="year")
+    pivots = pv.for_frame(dataframe, target_column)
+    if pivots is not None:
+        countries = list(dict.fromkeys(selected_country))
+        years, values, mask = pivots.block(target_column, countries, dataframe, selected_year_range)
+        year_positions, country_positions = np.nonzero(mask.T)
+        filtered_data = pd.DataFrame({
+            "country": pd.Categorical.from_codes(country_positions, categories=countries),
+            "year": years[year_positions],
+            target_column: values[country_positions, year_positions],
+        })
+    else:
+        filtered_data = dataframe[(dataframe["country"].isin(selected_country)) 
+                                  & (dataframe["year"] >= selected_year_range[0]) 
+                                  & (dataframe["year"] <= selected_year_range[1])]
+
+        filtered_data = filtered_data.sort_values(by="year")
     
     color_map = {country: color_palette[i % len(color_palette)] for i, country in enumerate(selected_country)}
 
@@ -173,19 +228,15 @@ def chart(dataframe, selected_country, selected_year_range, target_column, log_s
 
     return fig
 
-def map_chart(merged_dataframe, filtered_dataframe, is_filtered, selected_continent, selected_year_range, selected_countries, target_column):
-    if filtered_dataframe.empty:
-        st.warning("None of the selected countries fit the filters.")
-        return None
-
+@prof.profiled("map_arguments", rows_in=lambda merged_dataframe, filtered_dataframe, *args: len(filtered_dataframe))
+def map_arguments(merged_dataframe, filtered_dataframe, is_filtered, selected_continent, selected_year_range, selected_countries, target_column) -> tuple:
+    """Arguments of `bj.map_figure` for the current selection."""
     year_dataframe = filtered_dataframe[
         (filtered_dataframe["year"] >= selected_year_range[0]) & 
         (filtered_dataframe["year"] <= selected_year_range[1])
     ]
     
-    year_dataframe = year_dataframe.sort_values(by="year")
-
-    percentile_threshold = merged_dataframe[target_column].quantile(0.98)
+    percentile_threshold = s.get_dataset_metadata(merged_dataframe).quantile(target_column, 0.98)
 
     title_text = (
     f"Combined Attributes Map Over Time"
@@ -193,60 +244,22 @@ def map_chart(merged_dataframe, filtered_dataframe, is_filtered, selected_contin
     else "CO₂ per Capita Map Over Time"
 )
 
-    map_fig = px.choropleth(
-        year_dataframe, 
-        locations="country",
-        locationmode="country names", 
-        color=target_column,  
-        color_continuous_scale="Viridis", 
-        labels={target_column: "CO2 per Capita (tonnes)"},
-        title=title_text, 
-        hover_name="country", 
-        hover_data=[target_column],
-        animation_frame="year",  
-        range_color=[0, percentile_threshold] 
-    )
-
-    continent_scope = {
-        "World": "world",
-        "Europe": "europe",
-        "Asia": "asia",
-        "North America": "north america",
-        "South America": "south america",
-        "Africa": "africa"
-    }
-
-    map_fig.update_geos(
-        scope=continent_scope[selected_continent],  
-        showcoastlines=True, 
-        coastlinecolor="Black",
-        projection_type="natural earth",
-    )
-
-    selected_countries_df = filtered_dataframe[filtered_dataframe["country"].isin(selected_countries)]
-
-    scatter_trace = go.Scattergeo(
-    locations=selected_countries_df["country"],
-    locationmode="country names",
-    mode="markers",  
-    marker=dict(
-        size=4,  
-        color="red", 
-        line=dict(width=4, color="red"), 
-    ),
-    showlegend=False,  
-    hoverinfo='location', 
-)
-    map_fig.add_trace(scatter_trace)
-
-    map_fig.update_layout(
-        autosize=True,  
-        height=600,  
-        title=dict(font=dict(size=24))  
+    pivots = pv.for_frame(filtered_dataframe)
+    if pivots is not None:
+        marked_countries = pivots.countries_in(filtered_dataframe, selected_countries)
+    else:
+        marked_countries = list(filtered_dataframe.loc[filtered_dataframe["country"].isin(selected_countries), "country"].unique())
+
+    return (
+        year_dataframe,
+        target_column,
+        selected_continent,
+        title_text,
+        percentile_threshold,
+        "CO2 per Capita (tonnes)",
+        np.asarray(marked_countries, dtype=object),
     )
 
-    return map_fig
-
 # def pie_chart(dataframe, selected_year_range, is_filtered, selected_countries, target_column):
 #     filtered_dataframe = dataframe[
 #         (dataframe["year"] >= selected_year_range[0]) & 
@@ -303,17 +316,42 @@ def map_chart(merged_dataframe, filtered_dataframe, is_filtered, selected_contin
 
 #     return pie_fig
 
-def bar_chart(dataframe, selected_year_range, is_filtered, selected_countries, target_column):
-    filtered_dataframe = dataframe[
-        (dataframe["year"] >= selected_year_range[0]) & 
-        (dataframe["year"] <= selected_year_range[1])
-    ]
-    
+@prof.profiled("bar_chart")
+def bar_chart(dataframe, selected_year_range, is_filtered, selected_countries, target_column, rollups=None):
+    """Average of `target_column` per selected country over the year range.
+
+    With `rollups` (the RollupStore of the rows the attribute filters
+    keep, see `s.get_rollups`) the averages come from its prefix sums. Otherwise they are averaged from the cells of
+    `dataframe`'s rows in the dataset's country x year matrix (or from
+    `dataframe` itself).
+    """
     color_map = {country: color_palette[i % len(color_palette)] for i, country in enumerate(selected_countries)}
 
-    filtered_countries_df = filtered_dataframe[filtered_dataframe["country"].isin(selected_countries)]
-    
-    data_by_country = filtered_countries_df.groupby("country")[target_column].mean().reset_index()
+    pivots = pv.for_frame(dataframe, target_column)
+    if rollups is not None:
+        data_by_country = (
+            rollups.country_means(target_column, selected_countries, selected_year_range)
+            .rename_axis("country").reset_index()
+        )
+    elif pivots is not None:
+        _, values, mask = pivots.block(target_column, selected_countries, dataframe, selected_year_range)
+        counts = (~np.isnan(values)).sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = np.where(counts > 0, np.nansum(values, axis=1, dtype=np.float64) / counts, np.nan)
+        shown = mask.any(axis=1)
+        data_by_country = pd.DataFrame({
+            "country": np.asarray(selected_countries, dtype=object)[shown],
+            target_column: means[shown],
+        })
+    else:
+        filtered_dataframe = dataframe[
+            (dataframe["year"] >= selected_year_range[0]) & 
+            (dataframe["year"] <= selected_year_range[1])
+        ]
+
+        filtered_countries_df = filtered_dataframe[filtered_dataframe["country"].isin(selected_countries)]
+        
+        data_by_country = filtered_countries_df.groupby("country", observed=True)[target_column].mean().reset_index()
 
     chart_title = (
         f"Combined Attribute(s) <br>(Average from {selected_year_range[0]} to {selected_year_range[1]})"
@@ -1,19 +1,23 @@
 import streamlit as st
 import src.service as s
+import src.filter_engine as fe
+import src.indicator_registry as ir
+import src.profiler as prof
 
+@prof.profiled("sidebar.filtering")
 def filtering(dataframe):
     help_button()
 
-    is_filtered = False
+    metadata = s.get_dataset_metadata(dataframe)
 
-    continents = s.get_unique_continents([dataframe])
-    countries = s.get_unique_countries([dataframe])
+    continents = [continent for continent in metadata.continents if continent != "Oceania"]
+    countries = metadata.countries
     selected_continent = st.sidebar.selectbox("Select Continent", ["World"] + continents)
 
     if selected_continent == "World":
         filtered_countries = countries
     else:
-        filtered_countries = s.get_countries_by_continent([dataframe], selected_continent)
+        filtered_countries = metadata.countries_in(selected_continent)
 
     selected_country = st.sidebar.multiselect(
         "Select Country",
@@ -23,7 +27,7 @@ def filtering(dataframe):
     if not selected_country:
         st.info("Select a country to unlock more interaction tools!")
 
-    years = s.get_unique_years([dataframe])
+    years = metadata.years
     selected_year_range = st.sidebar.slider(
         "Select Year Range", 
         min(years), 
@@ -31,111 +35,48 @@ def filtering(dataframe):
         (min(years), max(years))
     )
 
-    apply_life_expectancy = False
-    apply_gdp = False
-    apply_carbon_tax = False
-    apply_renewables = False
-
-    life_expectancy_min, life_expectancy_max = int(dataframe["Life_expectancy"].min()), int(dataframe["Life_expectancy"].max())
-    co2_min, co2_max = int(dataframe["co2_per_capita"].min()), 30  
-    gdp_min, gdp_max = int(dataframe["GDP_per_capita"].min()), int(dataframe["GDP_per_capita"].max())
-    carbon_tax_min, carbon_tax_max = int(dataframe["Carbon_tax"].min()), int(dataframe["Carbon_tax"].max())
-    renewables_min, renewables_max = int(dataframe["Renewables"].min()), int(dataframe["Renewables"].max())
-
-    co2_min, co2_max = st.sidebar.slider(
-        "CO₂ per Capita in tonnes", 
-        int(dataframe["co2_per_capita"].min()), 
-        30,  
-        (int(dataframe["co2_per_capita"].min()), 30) 
-    )
+    predicates = []
+    attribute_filters = ir.attribute_filters(s.indicators, dataframe.columns)
+
+    for indicator in [indicator for indicator in attribute_filters if not indicator.filter.checkbox]:
+        predicates.append(range_filter(indicator, metadata))
 
     st.sidebar.subheader("Filter by Attributes")
 
-    # Life Expectancy filter
-    apply_life_expectancy = st.sidebar.checkbox("Apply Life Expectancy Filter", value=False)
-    if apply_life_expectancy:
-        life_expectancy_min, life_expectancy_max = st.sidebar.slider(
-            "Life Expectancy in years", 
-            int(dataframe["Life_expectancy"].min()), 
-            int(dataframe["Life_expectancy"].max()), 
-            (int(dataframe["Life_expectancy"].min()), int(dataframe["Life_expectancy"].max()))
-        )
-
-    # GDP per capita filter
-    apply_gdp = st.sidebar.checkbox("Apply GDP per Capita Filter", value=False)
-    if apply_gdp:
-        gdp_min, gdp_max = st.sidebar.slider(
-            "GDP per Capita in USD", 
-            int(dataframe["GDP_per_capita"].min()), 
-            int(dataframe["GDP_per_capita"].max()), 
-            (int(dataframe["GDP_per_capita"].min()), int(dataframe["GDP_per_capita"].max()))
-        )
-        
-    # Carbon Tax filter
-    apply_carbon_tax = st.sidebar.checkbox("Apply Carbon Tax Filter", value=False)
-    if apply_carbon_tax:
-        carbon_tax_min, carbon_tax_max = st.sidebar.slider(
-            "Carbon Tax (USD per tonne of CO₂ equivalent)", 
-            int(dataframe["Carbon_tax"].min()), 
-            int(dataframe["Carbon_tax"].max()), 
-            (int(dataframe["Carbon_tax"].min()), int(dataframe["Carbon_tax"].max()))
-        )
-
-    # Renewables filter
-    apply_renewables = st.sidebar.checkbox("Apply Renewables Filter", value=False)
-    if apply_renewables:
-        renewables_min, renewables_max = st.sidebar.slider(
-            "Renewables (%) (proportion of the total energy consumed by a country, that comes from renewable energy sources in %)", 
-            int(dataframe["Renewables"].min()), 
-            int(dataframe["Renewables"].max()), 
-            (int(dataframe["Renewables"].min()), int(dataframe["Renewables"].max()))
-        )
-
-    filtered_data = dataframe
-    
     is_filtered = False
-    filtered_data = filtered_data[(
-        filtered_data["co2_per_capita"] >= co2_min) & 
-        (filtered_data["co2_per_capita"] <= co2_max)
-    ]
-
-    if apply_life_expectancy:
-        is_filtered = True
-        filtered_data = filtered_data[(
-            filtered_data["Life_expectancy"] >= life_expectancy_min) & 
-            (filtered_data["Life_expectancy"] <= life_expectancy_max)
-        ]
-
-    if apply_gdp:
-        is_filtered = True
-        filtered_data = filtered_data[(
-            filtered_data["GDP_per_capita"] >= gdp_min) & 
-            (filtered_data["GDP_per_capita"] <= gdp_max)
-        ]
-
-    if apply_carbon_tax:
-        is_filtered = True
-        filtered_data = filtered_data[(
-            filtered_data["Carbon_tax"] >= carbon_tax_min) & 
-            (filtered_data["Carbon_tax"] <= carbon_tax_max)
-        ]
-
-    if apply_renewables:
-        is_filtered = True
-        filtered_data = filtered_data[(
-            filtered_data["Renewables"] >= renewables_min) & 
-            (filtered_data["Renewables"] <= renewables_max)
-        ]
+    for indicator in [indicator for indicator in attribute_filters if indicator.filter.checkbox]:
+        if st.sidebar.checkbox(indicator.filter.checkbox, value=False):
+            is_filtered = True
+            predicates.append(range_filter(indicator, metadata))
 
     if selected_country:
-        filtered_data = filtered_data[filtered_data["country"].isin(selected_country)]
+        predicates.append(fe.SetPredicate("country", tuple(selected_country)))
+
+    predicates.append(fe.RangePredicate("year", selected_year_range[0], selected_year_range[1]))
+
+    # Attribute ranges that drop rows, including the always-on sliders (CO₂)
+    # when they are tighter than their column; the bar chart's rollups apply them.
+    attribute_predicates = tuple(
+        predicate for predicate in predicates
+        if predicate.column not in ("country", "year") and narrows(predicate, metadata)
+    )
+
+    positions = fe.select_rows(dataframe, predicates, s.get_dataset_index(dataframe))
+    filtered_data = dataframe.iloc[positions]
+
+    return filtered_data, is_filtered, selected_continent, selected_country, selected_year_range, attribute_predicates
 
-    filtered_data = filtered_data[(
-        filtered_data["year"] >= selected_year_range[0]) & 
-        (filtered_data["year"] <= selected_year_range[1])
-    ]
+def narrows(predicate: fe.RangePredicate, metadata) -> bool:
+    """Whether the range is tighter than its column's, so it drops rows."""
+    low, high = metadata.column_range(predicate.column)
+    return predicate.low > low or predicate.high < high
 
-    return filtered_data, is_filtered, selected_continent, selected_country, selected_year_range
+def range_filter(indicator, metadata) -> fe.RangePredicate:
+    """Slider for one registry indicator, bounded by the dataset (or the registry's fixed maximum)."""
+    low = int(metadata.minimums[indicator.name])
+    high = int(indicator.filter.max) if indicator.filter.max is not None else int(metadata.maximums[indicator.name])
+    low, high = st.sidebar.slider(indicator.filter.slider, low, high, (low, high))
+    return fe.RangePredicate(indicator.name, low, high)
 
 @st.dialog("Help")
 def help_dialog():
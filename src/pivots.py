@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+from repoze.lru import LRUCache
+
+# Stores of the datasets loaded in this process, by dataset fingerprint, so
+# code handed only a selection of a dataset (such as a background job) can
+# find its matrices.
+pivot_stores = LRUCache(8)
+
+class PivotStore:
+    """Dense country x year float32 matrix per metric of a loaded dataset.
+
+    Countries are the integer codes of the dataset's country categories and
+    years are offsets from its first year, so a country's series is a row
+    slice and a year range a column slice. Every dataset row also maps to
+    its cell, which turns any row selection of the dataset into a country x
+    year mask without rescanning the long table. A selection keeps the
+    dataset's row positions as its labels unless its index was reset, which
+    `positions` checks against those cells.
+    """
+
+    def __init__(self, dataframe: pd.DataFrame, columns: list = None):
+        self.fingerprint = dataframe.attrs.get("fingerprint")
+        self.columns = list(columns if columns is not None else dataframe.select_dtypes(include="number").columns.drop("year", errors="ignore"))
+        self.rows = len(dataframe)
+
+        country = dataframe["country"]
+        if not isinstance(country.dtype, pd.CategoricalDtype):
+            country = country.astype("category")
+        self.country_dtype = country.dtype
+        self.countries = list(country.cat.categories)
+        self.country_codes = {name: code for code, name in enumerate(self.countries)}
+
+        years = dataframe["year"].to_numpy().astype(np.int64)
+        self.first_year = int(years.min()) if len(years) else 0
+        self.year_count = int(years.max()) - self.first_year + 1 if len(years) else 0
+        self.years = np.arange(self.first_year, self.first_year + self.year_count)
+        self.cells = country.cat.codes.to_numpy().astype(np.int64) * self.year_count + (years - self.first_year)
+
+        shape = (len(self.countries), self.year_count)
+        self.present = np.zeros(shape, dtype=bool)
+        self.present.flat[self.cells] = True
+        self.matrices = {}
+        for column in self.columns:
+            matrix = np.full(shape, np.nan, dtype=np.float32)
+            matrix.flat[self.cells] = dataframe[column].to_numpy(dtype=np.float32)
+            self.matrices[column] = matrix
+
+    def positions(self, dataframe: pd.DataFrame) -> np.ndarray:
+        """Row positions of `dataframe` in the dataset, or None when its labels are not them.
+
+        The labels are taken as positions only if the (country, year) of
+        every row matches the dataset row at its label.
+        """
+        if not {"country", "year"} <= set(dataframe.columns) or not pd.api.types.is_integer_dtype(dataframe.index.dtype):
+            return None
+        labels = dataframe.index.to_numpy()
+        if len(labels) and (labels.min() < 0 or labels.max() >= self.rows):
+            return None
+        country = dataframe["country"]
+        if country.dtype == self.country_dtype:
+            codes = country.cat.codes.to_numpy().astype(np.int64)
+        else:
+            codes = pd.Index(self.countries).get_indexer(country)
+        years = dataframe["year"].to_numpy().astype(np.int64) - self.first_year
+        known = (codes >= 0) & (years >= 0) & (years < self.year_count)
+        if not known.all() or not np.array_equal(self.cells[labels], codes * self.year_count + years):
+            return None
+        return labels
+
+    def codes(self, countries: list) -> np.ndarray:
+        """Row of each country, -1 for countries not in the dataset."""
+        return np.array([self.country_codes.get(country, -1) for country in countries], dtype=np.int64)
+
+    def _bounds(self, year_range: tuple) -> slice:
+        if year_range is None:
+            return slice(0, self.year_count)
+        low = int(np.clip(year_range[0] - self.first_year, 0, self.year_count))
+        high = int(np.clip(year_range[1] - self.first_year + 1, low, self.year_count))
+        return slice(low, high)
+
+    def selected(self, dataframe: pd.DataFrame = None) -> np.ndarray:
+        """Country x year mask of the cells with a row in `dataframe`, a row selection of the dataset."""
+        if dataframe is None or len(dataframe) == self.rows:
+            return self.present
+        mask = np.zeros_like(self.present)
+        mask.flat[self.cells[dataframe.index.to_numpy()]] = True
+        return mask
+
+    def block(self, column: str, countries: list, dataframe: pd.DataFrame = None,
+              year_range: tuple = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Years, values and row mask of `column` for `countries` over `year_range` (inclusive).
+
+        Rows follow `countries`; values are NaN and the mask False outside
+        the selection `dataframe` and for countries not in the dataset.
+        """
+        codes = self.codes(countries)
+        known = codes >= 0
+        years = self._bounds(year_range)
+        values = np.full((len(codes), years.stop - years.start), np.nan, dtype=np.float32)
+        mask = np.zeros(values.shape, dtype=bool)
+        mask[known] = self.selected(dataframe)[codes[known], years]
+        values[mask] = self.matrices[column][codes[known], years][mask[known]]
+        return self.years[years], values, mask
+
+    def countries_in(self, dataframe: pd.DataFrame, countries: list) -> list:
+        """The `countries` with at least one row in the selection `dataframe`."""
+        codes = self.codes(countries)
+        selected = self.selected(dataframe)
+        return [country for country, code in zip(countries, codes) if code >= 0 and selected[code].any()]
+
+def register(store: PivotStore) -> PivotStore:
+    if store.fingerprint is not None:
+        pivot_stores.put(store.fingerprint, store)
+    return store
+
+def for_frame(dataframe: pd.DataFrame, column: str = None) -> PivotStore:
+    """The registered store of the dataset `dataframe` is a row selection of, or None.
+
+    None as well when the store lacks `column` or the frame's labels are
+    not its row positions.
+    """
+    store = _store(dataframe)
+    if store is None or (column is not None and column not in store.matrices):
+        return None
+    if store.positions(dataframe) is None:
+        return None
+    return store
+
+def row_positions(dataframe: pd.DataFrame) -> np.ndarray:
+    """Row positions of `dataframe` in its registered dataset, or None when they cannot be verified."""
+    store = _store(dataframe)
+    return store.positions(dataframe) if store is not None else None
+
+def _store(dataframe: pd.DataFrame) -> PivotStore:
+    fingerprint = dataframe.attrs.get("fingerprint")
+    return pivot_stores.get(fingerprint) if fingerprint is not None else None
@@ -0,0 +1,197 @@
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+PROFILE_ENV = "CO2_PROFILE"
+PROFILE_LOG_ENV = "CO2_PROFILE_LOG"
+PROFILE_QUERY_PARAM = "profile"
+
+_local = threading.local()
+
+@dataclass
+class StageRecord:
+    """Measurements of one instrumented stage within a rerun."""
+    stage: str
+    depth: int
+    wall_ms: float = 0.0
+    rows_in: int = None
+    rows_out: int = None
+    allocated_bytes: int = None
+    peak_bytes: int = None
+    payload_bytes: int = None
+    # Deferred sections: time from placing the placeholder to the job's result.
+    wait_ms: float = None
+
+@dataclass
+class _Run:
+    run_id: str
+    started: float
+    trace_memory: bool
+    records: list
+    stack: list
+
+def _active_run() -> _Run:
+    return getattr(_local, "run", None)
+
+def profiling_requested() -> bool:
+    """Profiling is opt-in: CO2_PROFILE=1 in the environment or ?profile=1 in the URL."""
+    if os.environ.get(PROFILE_ENV, "").lower() in ("1", "true", "yes"):
+        return True
+    try:
+        import streamlit as st
+        return st.query_params.get(PROFILE_QUERY_PARAM) == "1"
+    except Exception:
+        return False
+
+def start_run(enabled: bool = None) -> bool:
+    """Begin collecting stage records for the current script run. Returns whether profiling is on."""
+    enabled = profiling_requested() if enabled is None else enabled
+    stale = _active_run()
+    if stale is not None and stale.trace_memory:
+        # The previous run raised before reaching finish_run.
+        tracemalloc.stop()
+    if not enabled:
+        _local.run = None
+        return False
+    trace_memory = not tracemalloc.is_tracing()
+    if trace_memory:
+        tracemalloc.start()
+    _local.run = _Run(uuid.uuid4().hex[:12], time.time(), trace_memory, [], [])
+    return True
+
+def finish_run(log_path: str = None) -> list:
+    """Stop collecting, append the run to the JSON lines log (if configured) and return its records."""
+    run = _active_run()
+    _local.run = None
+    if run is None:
+        return []
+    if run.trace_memory:
+        tracemalloc.stop()
+
+    log_path = log_path or os.environ.get(PROFILE_LOG_ENV)
+    if log_path:
+        try:
+            with open(log_path, "a", encoding="utf-8") as log_file:
+                log_file.write(to_json_lines(run.records, run.run_id, run.started))
+        except OSError as error:
+            logger.warning("Could not write profile to %s: %s", log_path, error)
+    return run.records
+
+def to_json_lines(records: list, run_id: str = None, started: float = None) -> str:
+    return "".join(
+        json.dumps({"run_id": run_id, "started": started, **asdict(record)}) + "\n" for record in records
+    )
+
+def _row_count(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return len(value)
+    if isinstance(value, tuple) and value and isinstance(value[0], pd.DataFrame):
+        return len(value[0])
+    if hasattr(value, "data") and hasattr(value, "layout"):
+        traces = [*value.data, *(trace for frame in value.frames or () for trace in frame.data or ())]
+        return sum(_trace_points(trace) for trace in traces)
+    return None
+
+def _trace_points(trace) -> int:
+    for attribute in ("x", "locations", "z"):
+        values = getattr(trace, attribute, None)
+        if values is not None and not isinstance(values, str):
+            return len(values)
+    return 0
+
+@contextmanager
+def stage(name: str, rows_in: int = None):
+    """Time a block of the render pipeline. Yields its StageRecord (None when profiling is off)."""
+    run = _active_run()
+    if run is None:
+        yield None
+        return
+
+    parent = run.stack[-1] if run.stack else None
+    record = StageRecord(name, len(run.stack), rows_in=rows_in)
+    run.records.append(record)
+    run.stack.append(record)
+
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        if parent is not None:
+            parent._peak = max(getattr(parent, "_peak", 0), tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        start_bytes = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record.wall_ms = (time.perf_counter() - started) * 1000
+        if tracing and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max(getattr(record, "_peak", 0), peak)
+            record.allocated_bytes = current - start_bytes
+            record.peak_bytes = peak - start_bytes
+            if parent is not None:
+                parent._peak = max(getattr(parent, "_peak", 0), peak)
+        run.stack.pop()
+
+def profiled(name: str = None, rows_in=None):
+    """Decorator form of `stage`.
+
+    Rows in default to the length of the first DataFrame argument; pass a
+    callable taking the same arguments to count them differently. Rows out
+    are taken from a returned DataFrame (or the first item of a returned
+    tuple) or the number of points in a returned figure.
+    """
+    def decorator(function):
+        stage_name = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _active_run() is None:
+                return function(*args, **kwargs)
+            if rows_in is not None:
+                count = rows_in(*args, **kwargs)
+            else:
+                count = next((len(value) for value in (*args, *kwargs.values()) if isinstance(value, pd.DataFrame)), None)
+            with stage(stage_name, count) as record:
+                result = function(*args, **kwargs)
+                record.rows_out = _row_count(result)
+                return result
+        return wrapper
+    return decorator
+
+def render_panel(records: list, cache_stats: dict = None):
+    """Debug sidebar panel with the stages of the last run and the hit/miss counters of `cache_stats` (name -> stats)."""
+    import streamlit as st
+
+    if not records:
+        return
+    table = pd.DataFrame([
+        {
+            "stage": "  " * record.depth + record.stage,
+            "ms": round(record.wall_ms, 1),
+            "rows in": record.rows_in,
+            "rows out": record.rows_out,
+            "alloc KiB": None if record.allocated_bytes is None else round(record.allocated_bytes / 1024, 1),
+            "peak KiB": None if record.peak_bytes is None else round(record.peak_bytes / 1024, 1),
+            "payload KiB": None if record.payload_bytes is None else round(record.payload_bytes / 1024, 1),
+            "wait ms": None if record.wait_ms is None else round(record.wait_ms, 1),
+        }
+        for record in records
+    ])
+    total_ms = sum(record.wall_ms for record in records if record.depth == 0)
+    with st.sidebar.expander(f"Profiler · {total_ms:.0f} ms", expanded=True):
+        st.dataframe(table, hide_index=True, use_container_width=True)
+        if cache_stats:
+            st.dataframe(pd.DataFrame.from_dict(cache_stats, orient="index").rename_axis("cache").reset_index(),
+                         hide_index=True, use_container_width=True)
+        st.download_button("Export JSON lines", to_json_lines(records), file_name="profile.jsonl",
+                           mime="application/jsonl", key="profiler_export")
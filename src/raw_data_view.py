@@ -0,0 +1,59 @@
+import math
+import pandas as pd
+import streamlit as st
+import src.filter_engine as fe
+
+PAGE_SIZES = [25, 50, 100, 250]
+
+def select_sorted_rows(dataset: pd.DataFrame, predicates: list, sort_column: str = None, ascending: bool = True,
+                       index=None):
+    """Resolve filters and sort on the indexed dataset, returning row positions only."""
+    rows = fe.select_rows(dataset, predicates, index)
+    if sort_column is None:
+        return rows
+
+    if index is not None and index.row_count == len(dataset) and (
+            sort_column in index.sorted_rows or sort_column in index.category_codes):
+        return index.sort_rows(rows, sort_column, ascending)
+
+    order = dataset[sort_column].iloc[rows].reset_index(drop=True).sort_values(
+        ascending=ascending, na_position="last", kind="stable"
+    ).index.to_numpy()
+    return rows[order]
+
+def page_of(dataset: pd.DataFrame, rows, columns: list, page: int, page_size: int) -> pd.DataFrame:
+    """Materialize one page of `rows`, projected to `columns`."""
+    start = (page - 1) * page_size
+    return dataset.iloc[rows[start:start + page_size]][columns]
+
+def render_raw_data(container, dataset: pd.DataFrame, predicates: list = None, index=None, key: str = "raw_data"):
+    """Server-side paged table. Nothing is queried until the user asks to load the rows."""
+    predicates = list(predicates or [])
+    with container:
+        if not st.checkbox("Load raw data", value=False, key=f"{key}_load"):
+            st.caption("Tick **Load raw data** to browse the rows behind the heatmap page by page.")
+            return
+
+        col_columns, col_sort, col_order = st.columns([3, 2, 1])
+        columns = col_columns.multiselect(
+            "Columns", list(dataset.columns), default=list(dataset.columns), key=f"{key}_columns"
+        )
+        sort_column = col_sort.selectbox("Sort by", ["(none)"] + list(dataset.columns), key=f"{key}_sort")
+        ascending = col_order.radio("Order", ["Ascending", "Descending"], key=f"{key}_order") == "Ascending"
+
+        col_countries, col_size = st.columns([4, 1])
+        country_options = list(index.categories["country"]) if index is not None else sorted(dataset["country"].dropna().unique())
+        countries = col_countries.multiselect("Filter countries", country_options, key=f"{key}_countries")
+        page_size = col_size.selectbox("Rows per page", PAGE_SIZES, key=f"{key}_page_size")
+
+        if countries:
+            predicates.append(fe.SetPredicate("country", tuple(countries)))
+
+        rows = select_sorted_rows(
+            dataset, predicates, None if sort_column == "(none)" else sort_column, ascending, index
+        )
+        page_count = max(math.ceil(len(rows) / page_size), 1)
+        page = st.number_input("Page", min_value=1, max_value=page_count, value=1, step=1, key=f"{key}_page")
+
+        st.dataframe(page_of(dataset, rows, columns or list(dataset.columns), int(page), page_size), use_container_width=True)
+        st.caption(f"Page {int(page)} of {page_count} · {len(rows)} matching rows")
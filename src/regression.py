@@ -0,0 +1,57 @@
+import numpy as np
+
+def grouped_linear_fit(codes: np.ndarray, x: np.ndarray, y: np.ndarray, group_count: int) -> dict:
+    """Closed-form OLS of y on x for every group and for all points pooled.
+
+    Works from the grouped sums Σx, Σy, Σxy and Σx² (accumulated with
+    `np.bincount` around each group's mean for numerical stability), so all
+    fits come out of one vectorized pass. Each fit is returned as the two
+    endpoints of its line over the group's x range.
+
+    Returns a dict with per-group arrays `slope`, `intercept`, `x_range` and
+    `y_range` (index = group code, NaN for empty groups) and a `pooled` entry
+    holding the same fields as scalars / pairs.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    codes = np.asarray(codes)
+
+    count = np.bincount(codes, minlength=group_count).astype(np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_x = np.bincount(codes, weights=x, minlength=group_count) / count
+        mean_y = np.bincount(codes, weights=y, minlength=group_count) / count
+    dx = x - mean_x[codes]
+    dy = y - mean_y[codes]
+    sxx = np.bincount(codes, weights=dx * dx, minlength=group_count)
+    sxy = np.bincount(codes, weights=dx * dy, minlength=group_count)
+
+    slope = np.divide(sxy, sxx, out=np.zeros(group_count), where=sxx > 0)
+    intercept = mean_y - slope * mean_x
+
+    x_min = np.full(group_count, np.inf)
+    x_max = np.full(group_count, -np.inf)
+    np.minimum.at(x_min, codes, x)
+    np.maximum.at(x_max, codes, x)
+    empty = count == 0
+    x_min[empty] = x_max[empty] = np.nan
+
+    x_range = np.stack([x_min, x_max], axis=1)
+    y_range = intercept[:, None] + slope[:, None] * x_range
+
+    pooled = _pooled_fit(x, y)
+    return {"slope": slope, "intercept": intercept, "x_range": x_range, "y_range": y_range, "pooled": pooled}
+
+def _pooled_fit(x: np.ndarray, y: np.ndarray) -> dict:
+    if len(x) == 0:
+        return {"slope": np.nan, "intercept": np.nan, "x_range": (np.nan, np.nan), "y_range": (np.nan, np.nan)}
+    dx = x - x.mean()
+    sxx = (dx * dx).sum()
+    slope = (dx * (y - y.mean())).sum() / sxx if sxx > 0 else 0.0
+    intercept = y.mean() - slope * x.mean()
+    x_range = (x.min(), x.max())
+    return {
+        "slope": slope,
+        "intercept": intercept,
+        "x_range": x_range,
+        "y_range": (intercept + slope * x_range[0], intercept + slope * x_range[1]),
+    }
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+
+class RollupStore:
+    """Prefix sums and counts per (country, metric) along the year axis.
+
+    For every numeric column the store keeps a country x year matrix of
+    cumulative sums and cumulative non-missing counts, with a leading zero
+    column, so the mean of any country over any year range is two
+    subtractions. Prefix sums are linear, so continent and world aggregates
+    are the sums of their countries' prefix rows and are precomputed the
+    same way. Only real countries count towards them: the OWID aggregate
+    rows ("World", "Africa (EI)", income groups) have neither a continent
+    nor an ISO code and are left out.
+    """
+
+    def __init__(self, dataframe: pd.DataFrame, columns: list = None):
+        self.columns = list(columns if columns is not None else dataframe.select_dtypes(include="number").columns.drop("year", errors="ignore"))
+
+        country = dataframe["country"]
+        if not isinstance(country.dtype, pd.CategoricalDtype):
+            country = country.astype("category")
+        self.countries = list(country.cat.categories)
+        self.country_codes = {name: code for code, name in enumerate(self.countries)}
+        codes = country.cat.codes.to_numpy()
+
+        years = dataframe["year"].to_numpy().astype(np.int64)
+        self.first_year = int(years.min()) if len(years) else 0
+        self.year_count = int(years.max()) - self.first_year + 1 if len(years) else 0
+        year_codes = years - self.first_year
+
+        self.sums = {}
+        self.counts = {}
+        for column in self.columns:
+            values = dataframe[column].to_numpy(dtype=np.float64)
+            present = ~np.isnan(values)
+            sums = np.zeros((len(self.countries), self.year_count + 1))
+            counts = np.zeros((len(self.countries), self.year_count + 1), dtype=np.int32)
+            np.add.at(sums, (codes[present], year_codes[present] + 1), values[present])
+            np.add.at(counts, (codes[present], year_codes[present] + 1), 1)
+            self.sums[column] = np.cumsum(sums, axis=1)
+            self.counts[column] = np.cumsum(counts, axis=1, dtype=np.int32)
+
+        self.group_countries = self._groups(dataframe)
+        self.groups = list(self.group_countries)
+        self.group_sums = {column: self._group_prefix(self.sums[column]) for column in self.columns}
+        self.group_counts = {column: self._group_prefix(self.counts[column]) for column in self.columns}
+
+    def _groups(self, dataframe: pd.DataFrame) -> dict:
+        """Country codes per continent, and of every real country under "World"."""
+        keys = [column for column in ("continent", "Code") if column in dataframe.columns]
+        pairs = dataframe[["country", *keys]].dropna(subset=["country"]).drop_duplicates("country")
+        real = np.zeros(len(pairs), dtype=bool)
+        groups = {}
+        if "continent" in pairs.columns:
+            real |= pairs["continent"].notna().to_numpy()
+            for name, group in pairs.dropna(subset=["continent"]).groupby("continent", observed=True)["country"]:
+                groups[name] = np.array([self.country_codes[country] for country in group], dtype=np.int64)
+        if "Code" in pairs.columns:
+            # ISO alpha-3 codes; OWID's own "OWID_*" codes mark aggregates and historical entities.
+            real |= pairs["Code"].astype("string").str.fullmatch("[A-Z]{3}").to_numpy(dtype=bool, na_value=False)
+        groups["World"] = np.array([self.country_codes[country] for country in pairs["country"].to_numpy()[real]], dtype=np.int64)
+        return groups
+
+    def _group_prefix(self, prefix: np.ndarray) -> dict:
+        return {group: prefix[codes].sum(axis=0) for group, codes in self.group_countries.items()}
+
+    def _bounds(self, year_range: tuple) -> tuple[int, int]:
+        if year_range is None:
+            return 0, self.year_count
+        low = int(np.clip(year_range[0] - self.first_year, 0, self.year_count))
+        high = int(np.clip(year_range[1] - self.first_year + 1, low, self.year_count))
+        return low, high
+
+    def country_means(self, column: str, countries: list, year_range: tuple = None) -> pd.Series:
+        """Mean of `column` per country over `year_range` (inclusive); NaN where a country has no values."""
+        low, high = self._bounds(year_range)
+        codes = np.array([self.country_codes.get(country, -1) for country in countries], dtype=np.int64)
+        known = codes >= 0
+        sums = np.zeros(len(codes))
+        counts = np.zeros(len(codes))
+        sums[known] = self.sums[column][codes[known], high] - self.sums[column][codes[known], low]
+        counts[known] = self.counts[column][codes[known], high] - self.counts[column][codes[known], low]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return pd.Series(np.where(counts > 0, sums / counts, np.nan), index=list(countries), name=column)
+
+    def group_mean(self, column: str, group: str = "World", year_range: tuple = None) -> float:
+        """Mean of all values of `column` in a continent (or "World") over `year_range` (inclusive)."""
+        low, high = self._bounds(year_range)
+        sums, counts = self.group_sums[column][group], self.group_counts[column][group]
+        count = counts[high] - counts[low]
+        return (sums[high] - sums[low]) / count if count > 0 else np.nan
+
+    def group_series(self, column: str, group: str = "World") -> pd.Series:
+        """Yearly mean of `column` across the countries of a continent (or "World")."""
+        sums = np.diff(self.group_sums[column][group])
+        counts = np.diff(self.group_counts[column][group])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            values = np.where(counts > 0, sums / counts, np.nan)
+        return pd.Series(values, index=np.arange(self.first_year, self.first_year + self.year_count), name=column)
@@ -1,7 +1,35 @@
+"""Streamlit adapter over `src.data_engine`.
+
+Re-exports the data functions the pages use, reports merge warnings with
+`st.warning` and keeps one process-wide `DataEngine` in `st.cache_resource`.
+"""
 import streamlit as st
 import pandas as pd
-import numpy as np
-import pycountry_convert as pc
+import src.data_engine as de
+import src.background_jobs as bj
+from src.data_engine import (
+    CONTINENT_INDEX_PATH,
+    add_continent_column,
+    country_to_continent,
+    enable_copy_on_write,
+    filter_by_continent,
+    get_countries_by_continent,
+    get_metrics,
+    get_unique_column_names,
+    get_unique_continents,
+    get_unique_countries,
+    get_unique_years,
+    get_year_range_from_countries,
+    load_continent_index,
+    predict_future_values_with_models,
+)
+from src.dataset_index import DatasetIndex
+from src.dataset_metadata import DatasetMetadata
+from src.correlation import CorrelationEngine
+from src.rollups import RollupStore
+
+file_mapping = de.FILE_MAPPING
+indicators = de.INDICATORS
 
 @st.cache_data
 def load_csv_data(file_paths: list) -> list:
@@ -12,91 +40,44 @@ def load_csv_data(file_paths: list) -> list:
 def load_default_file(file_path: str) -> pd.DataFrame:
     return pd.read_csv(file_path)
 
-def get_unique_column_names(dataframe: pd.DataFrame) -> list:
-  return [col for col in dataframe.columns if col not in ['country', 'iso_code', 'year']]
+def merge_dataframes(dataframes: dict) -> pd.DataFrame:
+    return de.merge_dataframes(dataframes, on_warning=st.warning)
 
-def get_metrics(dataframes: list[pd.DataFrame]) -> dict:
-  metrics = {}
-  for dataframe in dataframes:
-    for column in get_unique_column_names(dataframe):
-      metrics[column] = (dataframe, column)
-      
-  return metrics
+def build_merged_dataset(file_mapping: dict) -> pd.DataFrame:
+    return de.build_merged_dataset(file_mapping, on_warning=st.warning)
 
-def merge_dataframes(dataframes: dict) -> pd.DataFrame:
-    """Merge all datasets into a single DataFrame on 'country' and 'year'."""
-    merged_df = None
-    
-    for name, df in dataframes.items(): 
-        if not {'country', 'year'}.issubset(df.columns):
-            st.warning(f"Dataset {name} is missing required columns ('country', 'year'). Skipping.")
-            continue
-        
-        if merged_df is None:
-            merged_df = df
-        else:
-            merged_df = pd.merge(merged_df, df, on=['country', 'year', 'Code'], how='outer')
-    
-    return merged_df
+@st.cache_resource
+def get_engine(file_mapping: dict = file_mapping) -> de.DataEngine:
+    """The DataEngine shared by every session of this server process."""
+    return de.DataEngine(file_mapping, on_warning=st.warning)
+
+@st.cache_resource
+def get_job_runner() -> bj.JobRunner:
+    """The background worker pool shared by every session of this server process."""
+    return bj.JobRunner(get_engine())
 
-def get_unique_countries(dataframes: list[pd.DataFrame]) -> list:
-  unique_countries = set()
-  for dataframe in dataframes:
-    unique_countries.update(dataframe['country'].unique())
-  return sorted(unique_countries)
+def load_merged_dataset(file_mapping: dict = file_mapping) -> pd.DataFrame:
+    """Load the merged dataset from the columnar cache, rebuilding it when a source CSV changes.
 
-def get_unique_years(dataframes: list[pd.DataFrame]) -> list:
-  unique_years = set()
-  for dataframe in dataframes:
-    unique_years.update(dataframe['year'].unique())
-  return sorted(unique_years)
+    Every session receives the same frame: its float columns are zero-copy
+    views of the memory-mapped Arrow file. Copy-on-write (switched on at app
+    start by `enable_copy_on_write` on pandas < 3) keeps derived frames from
+    writing through to it; the shared frame itself must never be modified in place.
+    """
+    return get_engine(file_mapping).load_dataset()
 
-def get_year_range_from_countries(dataframes: list[pd.DataFrame], countries: list[str]):
-  unique_years = set()
-  for dataframe in dataframes:
-    unique_years.update(dataframe[dataframe["country"].isin(countries)]["year"].unique())
-  return sorted(unique_years)
+def get_dataset_index(dataframe: pd.DataFrame) -> DatasetIndex:
+    """Return the sorted indexes of a loaded dataset, built once per dataset version."""
+    return get_engine().dataset_index(dataframe)
 
-def predict_future_values_with_models(country_specific_data: pd.DataFrame, selected_metric: str, years_to_predict: int, model_to_use):
-  x = country_specific_data[["year"]]
-  y = country_specific_data[selected_metric]
-  
-  model = model_to_use
-  model.fit(x, y)
-  
-  future_years = np.array(range(x["year"].max() + 1, x["year"].max() + 1 + years_to_predict)).reshape(-1, 1)
-  
-  predictions = model.predict(future_years)
-  
-  return future_years, predictions,
+def get_dataset_metadata(dataframe: pd.DataFrame) -> DatasetMetadata:
+    """Return the column bounds and unique values of a loaded dataset, computed once per dataset version."""
+    return get_engine().dataset_metadata(dataframe)
 
-def country_to_continent(country_name):
-    try:
-        
-        country_alpha2 = pc.country_name_to_country_alpha2(country_name)
-        country_continent_code = pc.country_alpha2_to_continent_code(country_alpha2)
-        country_continent_name = pc.convert_continent_code_to_continent_name(country_continent_code)
-        return country_continent_name
-    except Exception as e:
-        return None
-    
-def get_unique_continents(dataframes: list) -> list:
-    continents = set()  
-    for dataframe in dataframes:
-        for country in dataframe['country'].unique():  
-            continent = country_to_continent(country)  
-            if continent and continent != 'Oceania':  
-                continents.add(continent)
-    return sorted(continents)  
+def get_correlation_engine(dataframe: pd.DataFrame) -> CorrelationEngine:
+    """Return the block correlation statistics of a loaded dataset, built once per dataset version."""
+    return get_engine().correlation_engine(dataframe)
 
-def get_countries_by_continent(dataframes: list, selected_continent: str) -> list:
-    countries_in_continent = set()
-    for dataframe in dataframes:
-        for country in dataframe['country'].unique():
-            try:
-                continent = country_to_continent(country)
-                if continent == selected_continent:
-                    countries_in_continent.add(country)
-            except Exception as e:
-                pass
-    return sorted(countries_in_continent)
\ No newline at end of file
+def get_rollups(dataframe: pd.DataFrame, predicates: tuple = ()) -> RollupStore:
+    """Return the year-axis prefix sums of a loaded dataset, or of the rows `predicates` keep."""
+    return get_engine().rollups(dataframe, predicates)